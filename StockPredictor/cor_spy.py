@@ -6,7 +6,7 @@ import matplotlib.pyplot as plt
 import math, os, sys
 
 # Import dataset retrieval
-from dataset_construction import create_input, create_output
+from dataset_construction import create_input, create_output, load_price_panel
 # Import normalization
 from helpers.normalization import mean_normalization
 
@@ -15,9 +15,9 @@ spy_list = list(fhand.Symbols)
 results = pd.DataFrame()
 results = results.append({'Date': np.nan, "Return Date": np.nan, 'Symbol': np.nan, 'Return': np.nan, 'Test Error (RMSE)': np.nan}, ignore_index=True)
 
-df = create_input(spy_list[0])
-for sym in spy_list[1:]:
-	if sym == "ADT": continue
-	df = df.join(create_input(sym, indicators=[], store=False))
+symbols = spy_list[:1] + [sym for sym in spy_list[1:] if sym != "ADT"]
+# every symbol on the dates of the first one, as joining them one by one did
+panel, dates = load_price_panel(symbols, dates=create_input(spy_list[0]).index)
+df = pd.DataFrame(panel.T, index=dates, columns=["AdjClose_"+sym for sym in symbols])
 
 df.corr().to_csv("StockCorrelations.csv")
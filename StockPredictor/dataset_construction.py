@@ -1,6 +1,202 @@
 import datetime as dt
 import os
+import shutil
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
+from indicators.intermediates import Intermediates, compute_indicators
+
+# Columnar copy of the webdata csv files. Each symbol gets a folder holding
+# a Date index and, for each dtype, one raw (columns, rows) array file of the
+# columns of that dtype, the layout pandas keeps a block of columns in, so the
+# price columns can be memory-mapped without a copy. columns.txt lists each
+# column with its dtype.
+STORE_DIR = os.path.join("webdata", "store")
+
+def _store_path(symbol):
+	return os.path.join(STORE_DIR, symbol)
+
+def _block_file(path, dtype):
+	return os.path.join(path, "block_{}.bin".format(np.dtype(dtype).name))
+
+def store_web_data(symbol, dframe):
+	"""Write @dframe to the columnar price store so later reads can memory-map it
+	instead of parsing webdata/<symbol>.csv. The entry is written to a temporary
+	folder and renamed into place, so readers never see a partly written one."""
+	path = _store_path(symbol)
+	tmp = "{}.tmp{}".format(path, os.getpid())
+	if os.path.isdir(tmp):
+		shutil.rmtree(tmp)
+	os.makedirs(tmp)
+	try:
+		dframe.index.values.astype("<i8").tofile(os.path.join(tmp, "Date.bin"))
+		manifest = []
+		blocks = OrderedDict()
+		for col in dframe.columns:
+			values = dframe[col].values
+			dtype = values.dtype.newbyteorder("<")
+			blocks.setdefault(dtype.str, []).append(values.astype(dtype))
+			manifest.append("{} {}".format(col, dtype.str))
+		for dtype, values in blocks.items():
+			np.array(values, dtype=dtype).tofile(_block_file(tmp, dtype))
+		with open(os.path.join(tmp, "columns.txt"), "w") as fhand:
+			fhand.write("\n".join(manifest))
+		# readers that mapped the old entry keep their mapping after it is removed
+		old = "{}.old{}".format(path, os.getpid())
+		if os.path.isdir(path):
+			os.rename(path, old)
+		os.rename(tmp, path)
+		if os.path.isdir(old):
+			shutil.rmtree(old)
+	except:
+		shutil.rmtree(tmp, ignore_errors=True)
+		raise
+
+def _map_array(filename, dtype, shape):
+	if os.path.getsize(filename) == 0:
+		return np.empty(shape, dtype=dtype)
+	return np.memmap(filename, dtype=dtype, mode="r", shape=shape)
+
+def read_stored_web_data(symbol):
+	"""Return the stored data for @symbol, or None if the store has no entry
+	or the entry is older than webdata/<symbol>.csv. The columns of the most
+	common dtype (the prices) are read-only views of their memory-mapped file,
+	so processes reading the same symbol share its pages; the others (Volume)
+	are copied into the frame."""
+	path = _store_path(symbol)
+	marker = os.path.join(path, "columns.txt")
+	filename = "webdata/{}.csv".format(symbol)
+	if not os.path.exists(marker):
+		return None
+	if os.path.exists(filename) and os.path.getmtime(filename) > os.path.getmtime(marker):
+		return None
+	with open(marker) as fhand:
+		manifest = [line.rsplit(" ", 1) for line in fhand.read().split("\n")]
+	date_file = os.path.join(path, "Date.bin")
+	index = pd.DatetimeIndex(np.fromfile(date_file, dtype="<i8"), name="Date")
+	items = OrderedDict()
+	for i, (col, dtype) in enumerate(manifest):
+		items.setdefault(dtype, []).append(i)
+	values = {}
+	for dtype, positions in items.items():
+		if not os.path.exists(_block_file(path, dtype)):
+			# written by an older version of the store
+			return None
+		values[dtype] = _map_array(_block_file(path, dtype), dtype, (len(positions), len(index)))
+	# a frame of one 2-D array keeps it as its block, so only one dtype can stay mapped
+	main = max(items, key=lambda dtype: len(items[dtype]))
+	dframe = pd.DataFrame(values[main].T, index=index,
+						  columns=[manifest[i][0] for i in items[main]], copy=False)
+	others = sorted((i, dtype, row) for dtype in items if dtype != main
+					for row, i in enumerate(items[dtype]))
+	for i, dtype, row in others:
+		dframe.insert(i, manifest[i][0], values[dtype][row])
+	return dframe
+
+def build_price_store(symbols=None):
+	"""Build the columnar price store from the csv files in the webdata folder.
+	Entries that are already up to date are left alone."""
+	if symbols is None:
+		symbols = [f[:-4] for f in os.listdir("webdata") if f.endswith(".csv")]
+	for symbol in symbols:
+		if read_stored_web_data(symbol) is None:
+			get_and_store_web_data(symbol, online=False)
+	return symbols
+
+class FrameCache(object):
+	"""Least recently used cache of read-only dataframes, bounded by the
+	number of bytes the cached frames hold."""
+	def __init__(self, max_bytes=256*1024**2):
+		self.max_bytes = max_bytes
+		self.frames = OrderedDict()
+		self.nbytes = 0
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key):
+		"""Return a shallow copy of the cached frame for @key, or None."""
+		try:
+			frame, nbytes = self.frames.pop(key)
+		except KeyError:
+			self.misses += 1
+			return None
+		self.frames[key] = (frame, nbytes)
+		self.hits += 1
+		return frame.copy(deep=False)
+
+	def put(self, key, frame):
+		"""Freeze @frame, cache it under @key and return a shallow copy of it."""
+		for block in frame._data.blocks:
+			block.values.flags.writeable = False
+		nbytes = int(frame.memory_usage(index=True).sum())
+		if key in self.frames:
+			self.nbytes -= self.frames.pop(key)[1]
+		self.frames[key] = (frame, nbytes)
+		self.nbytes += nbytes
+		while self.nbytes > self.max_bytes and len(self.frames) > 1:
+			_, (_, old_nbytes) = self.frames.popitem(last=False)
+			self.nbytes -= old_nbytes
+		return frame.copy(deep=False)
+
+	def clear(self):
+		self.frames.clear()
+		self.nbytes = 0
+		self.hits = 0
+		self.misses = 0
+
+	def info(self):
+		return {"hits": self.hits, "misses": self.misses,
+				"frames": len(self.frames), "nbytes": self.nbytes,
+				"max_bytes": self.max_bytes}
+
+# Shared by create_input, create_output and get_and_store_web_data.
+frame_cache = FrameCache()
+
+def cache_info():
+	"""Return hit/miss counters and memory use of the dataset cache."""
+	return frame_cache.info()
+
+def clear_cache():
+	frame_cache.clear()
+
+def _source_mtime(symbol):
+	"""Modification time of the data behind @symbol, used to invalidate cached frames."""
+	filename = "webdata/{}.csv".format(symbol)
+	if os.path.exists(filename):
+		return os.path.getmtime(filename)
+	marker = os.path.join(_store_path(symbol), "columns.txt")
+	if os.path.exists(marker):
+		return os.path.getmtime(marker)
+	return None
+
+def _indicator_key(indicator):
+	params = sorted((k, v) for k, v in vars(indicator).items()
+					if k != "data" and not k.startswith("_"))
+	return (indicator.__class__.__name__, tuple(params))
+
+def _cached_web_data(symbol):
+	"""Read-only frame of the offline data for @symbol."""
+	key = ("web_data", symbol, _source_mtime(symbol))
+	dframe = frame_cache.get(key)
+	if dframe is None:
+		dframe = frame_cache.put(key, _read_web_data(symbol))
+	return dframe
+
+def _read_web_data(symbol):
+	filename = "webdata/{}.csv".format(symbol)
+	# Read from the price store, falling back to the webdata folder
+	dframe = read_stored_web_data(symbol)
+	if dframe is None:
+		dframe = pd.read_csv(
+							filename, 
+							index_col='Date', 
+							parse_dates=True, 
+							na_values=['nan'])
+		try:
+			store_web_data(symbol, dframe)
+		except (IOError, OSError, ValueError):
+			pass
+	return dframe
 
 def get_and_store_web_data(symbol, online=False):
 		"""Retrieve historical data from yahoo finance based off start and end dates for 
@@ -22,13 +218,10 @@ def get_and_store_web_data(symbol, online=False):
 
 			# Write csv to webdata folder
 			dframe.to_csv(filename, index_label="Date")
+			store_web_data(symbol, dframe)
 		else:
-			# Read from webdata folder
-			dframe = pd.read_csv(
-								filename, 
-								index_col='Date', 
-								parse_dates=True, 
-								na_values=['nan'])
+			# Callers are free to modify the frame, so hand out a copy of the cached one
+			dframe = _cached_web_data(symbol).copy()
 		return dframe
 
 def populate_webdata(replace=True):
@@ -52,32 +245,69 @@ def populate_webdata(replace=True):
 				except: continue
 
 def create_output(symbol, horizon=5, use_prices=False):
-	"""Retrieve """
-	dframe = get_and_store_web_data(symbol, online=False)
+	"""Retrieve future returns (or prices) @horizon days ahead for @symbol.
+	The returned frame is read-only and shared with the dataset cache."""
+	key = ("output", symbol, _source_mtime(symbol), horizon, use_prices)
+	output = frame_cache.get(key)
+	if output is not None:
+		return output
+	dframe = _cached_web_data(symbol)
 	output = dframe[[col for col in dframe if col.startswith("Adj")]]
 	output.columns = ["y_"+symbol for col in output.columns]
 	if use_prices:
-		return output.shift(-horizon)
+		output = output.shift(-horizon)
 	else:
-		return output.shift(-horizon)/output - 1
+		output = output.shift(-horizon)/output - 1
+	return frame_cache.put(key, output)
 
 def create_input(symbol, indicators = [], store=False):
-	"""Retrieve historical data based off start and end dates for selected symbol."""
+	"""Retrieve historical data based off start and end dates for selected symbol.
+	The returned frame is shared with the dataset cache, so its values are
+	read-only: assigning to it raises, copy() it first to change it."""
 	filename = symbol+"_training.csv"
-	dframe = get_and_store_web_data(symbol, online=False)
-	dframe = dframe[[col for col in dframe.columns if col.startswith("Adj")]]
-	adj_close = dframe.pct_change().dropna()
-    
-	for indicator in indicators:
-		indicator.addEvidence(adj_close)
-		ind_values = indicator.getIndicator()
-		dframe = dframe.join(ind_values)
+	key = ("input", symbol, _source_mtime(symbol),
+		   tuple(_indicator_key(indicator) for indicator in indicators))
+	prices = _cached_web_data(symbol)
+	prices = prices[[col for col in prices.columns if col.startswith("Adj")]]
+	adj_close = prices.pct_change().dropna()
+	dframe = frame_cache.get(key)
+	if dframe is not None:
+		# the indicators still get their history, which update() builds on
+		for indicator in indicators:
+			indicator.addEvidence(adj_close)
+	else:
+		dframe = prices
+		# rolling means, deviations and such that the indicators have in common
+		# are computed once per symbol and kept for later indicator sets
+		shared = Intermediates(adj_close, frame_cache, ("intermediate", symbol, _source_mtime(symbol)))
+		for ind_values in compute_indicators(adj_close, indicators, shared):
+			dframe = dframe.join(ind_values)
+		dframe = frame_cache.put(key, dframe)
         
 	# Write training data to csv in training data folder
 	if store:
 		dframe.to_csv(filename, index_label="Date")
 	return dframe
 
+def load_price_panel(symbols, dates=None):
+	"""Retrieve the adjusted closes of @symbols as a symbols x dates array, for
+	indicators to compute the whole universe at once. A symbol is NaN on dates
+	it has no price for, such as before it was listed. The dates are the union
+	of the symbols' trading dates unless @dates are given.
+	Returns the panel and its dates."""
+	closes = []
+	for symbol in symbols:
+		dframe = _cached_web_data(symbol)
+		closes.append(dframe[[col for col in dframe.columns if col.startswith("Adj")][0]])
+	if dates is None:
+		dates = closes[0].index
+		for close in closes[1:]:
+			dates = dates.union(close.index)
+	panel = np.full((len(symbols), len(dates)), np.nan)
+	for i, close in enumerate(closes):
+		panel[i] = close.reindex(dates).values
+	return panel, dates
+
 if __name__ == "__main__":
 	symbol = "IBM"
 	out = create_output(symbol, horizon=5, use_prices=True)
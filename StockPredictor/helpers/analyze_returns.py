@@ -1,35 +1,47 @@
 import re
 import numpy as np
+import pandas as pd
 import sys
 
-"""Analyze the returns after running `python spy.py > spytest.txt` in the commandline.
+"""Analyze the returns in the spy_results.csv table written by `python spy.py`
+(or in the log of an older `python spy.py > spytest.txt` run) and
 return a comparison of the porfolio returns and the sharpe ratios."""
 try:
-        fhand = open(sys.argv[1])
+        filename = sys.argv[1]
 except IndexError:
-        fhand = open('spytest.txt')
+        filename = 'spytest.txt'
 
-port_returns = []
-spy_returns = []
-port_sharpe = []
-spy_sharpe = []
+if filename.endswith(".csv"):
+	# Results table written by spy.py
+	results = pd.read_csv(filename, index_col="Symbol")
+	port_returns = list(results.Cumulative_Return)
+	spy_returns = list(results.Bench_Cumulative_Return)
+	port_sharpe = list(results.Sharpe_Ratio)
+	spy_sharpe = list(results.Bench_Sharpe_Ratio)
+else:
+	# Log written by an older `python spy.py > spytest.txt`
+	port_returns = []
+	spy_returns = []
+	port_sharpe = []
+	spy_sharpe = []
 
-for line in fhand:
-	if re.search("Cumulative Return of Fund:", line):
-		returns = float(line.split()[-1])
-		port_returns.append(returns)
-	elif re.search("Cumulative Return of ", line):
-		returns = float(line.split()[-1])
-		spy_returns.append(returns)
-	if re.search("Sharpe Ratio of Fund:", line):
-		returns = float(line.split()[-1])
-		port_sharpe.append(returns)
-	elif re.search("Sharpe Ratio of ", line):
-		returns = float(line.split()[-1])
-		spy_sharpe.append(returns)
+	fhand = open(filename)
+	for line in fhand:
+		if re.search("Cumulative Return of Fund:", line):
+			returns = float(line.split()[-1])
+			port_returns.append(returns)
+		elif re.search("Cumulative Return of ", line):
+			returns = float(line.split()[-1])
+			spy_returns.append(returns)
+		if re.search("Sharpe Ratio of Fund:", line):
+			returns = float(line.split()[-1])
+			port_sharpe.append(returns)
+		elif re.search("Sharpe Ratio of ", line):
+			returns = float(line.split()[-1])
+			spy_sharpe.append(returns)
+	fhand.close()
 
 print "Average Portfolio Return: {}".format(np.mean(port_returns))
 print "Average SPY Return: {}".format(np.mean(spy_returns))
 print "Average Portfolio Sharpe Ratio: {}".format(np.nanmean(port_sharpe))
 print "Average SPY Sharpe Ratio: {}".format(np.nanmean(spy_sharpe))
-fhand.close()
@@ -1,11 +1,70 @@
 import numpy as np
 
+class MeanNormalizer(object):
+    """Normalizes features by the mean and standard deviation of the rows it
+    was fitted on. The statistics are computed once and reused by every
+    transform, and they can be updated as rows enter and leave a rolling
+    window (Welford/Chan updates) without another pass over the window.
+    The normalizer pickles with the model it was fitted for."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+        self.std = None
+
+    def fit(self, X):
+        """Computes the statistics of the rows of X, replacing earlier ones."""
+        X = np.asarray(X)
+        self.count = X.shape[0]
+        self.mean = X.mean(axis=0)
+        self.std = X.std(axis=0)
+        self.m2 = self.std**2*self.count
+        return self
+
+    def update(self, X):
+        """Adds the rows of X to the statistics."""
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        if self.count == 0:
+            return self.fit(X)
+        self._combine(X.shape[0], X.mean(axis=0), X.var(axis=0)*X.shape[0])
+        return self
+
+    def downdate(self, X):
+        """Removes the rows of X, which were added before, from the statistics."""
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        self._combine(-X.shape[0], X.mean(axis=0), -X.var(axis=0)*X.shape[0])
+        return self
+
+    def _combine(self, n, mean, m2):
+        # Chan et al. combination of two sets of rows; negative n removes rows
+        total = self.count + n
+        if total <= 0:
+            self.__init__()
+            return
+        delta = mean - self.mean
+        self.mean = self.mean + delta*n/total
+        self.m2 = np.maximum(self.m2 + m2 + delta**2*self.count*n/total, 0)
+        self.count = total
+        self.std = np.sqrt(self.m2/total)
+
+    def transform(self, X, copy=True):
+        """Returns X normalized by the statistics. With copy=False a float32 or
+        float64 array is normalized in place instead of allocating a new one."""
+        if copy:
+            return (X - self.mean)/self.std
+        X -= self.mean
+        X /= self.std
+        return X
+
+    def fit_transform(self, X):
+        return self.fit(X).transform(X)
+
 def mean_normalization(trainX, testX):
     """Returns the features normalized by the mean and standard deviation of
     feature values in the training set."""
-    trnX = ( trainX - trainX.mean(axis=0) )/trainX.std(axis=0)
-    tstX = ( testX - trainX.mean(axis=0) )/trainX.std(axis=0)
-    return trnX, tstX
+    normalizer = MeanNormalizer().fit(trainX)
+    return normalizer.transform(trainX), normalizer.transform(testX)
     
 def max_normalization(trainX, testX):
     """Returns the features normalized by the maximum 
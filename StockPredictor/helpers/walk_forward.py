@@ -0,0 +1,122 @@
+"""Walk-forward (rolling origin) evaluation of learners.
+
+A training window of the last @window rows slides across a feature matrix.
+At every step the learner is refitted on the window and queried on the next
+@step rows, so every prediction is out of sample. Results are returned as
+a structured array with one record per predicted row."""
+
+import numpy as np
+from learners.IncLinRegLearner import solve_normal_equations
+
+WALK_DTYPE = np.dtype([("Row", "i4"), ("Predicted", "f8"), ("Actual", "f8")])
+
+def _steps(n, window, step, gap):
+    """First test row of each step, and the training rows [start, end) before it."""
+    test_start = np.arange(window+gap, n, step)
+    train_end = test_start - gap
+    return test_start, train_end-window, train_end
+
+def window_stats(dataX, window):
+    """Returns the mean and standard deviation of each feature over the @window
+    rows ending before every row, from running sums. Row t of the result
+    describes rows [t-window, t); the first @window rows are NaN."""
+    # centering first keeps the running sums of squares small
+    centered = dataX - dataX.mean(axis=0)
+    sums = np.zeros((dataX.shape[0]+1, dataX.shape[1]))
+    sq_sums = np.zeros((dataX.shape[0]+1, dataX.shape[1]))
+    np.cumsum(centered, axis=0, out=sums[1:])
+    np.cumsum(centered**2, axis=0, out=sq_sums[1:])
+    means = np.empty(sums.shape)
+    means[:window] = np.nan
+    means[window:] = (sums[window:]-sums[:-window])/window
+    var = np.empty(sums.shape)
+    var[:window] = np.nan
+    var[window:] = (sq_sums[window:]-sq_sums[:-window])/window - means[window:]**2
+    return means + dataX.mean(axis=0), np.sqrt(np.maximum(var, 0))
+
+def walk_forward(dataX, dataY, learner, window=250, step=1, gap=0):
+    """
+    @summary: Walk a learner forward over a feature matrix.
+    @param dataX: (rows, features) array, oldest row first
+    @param dataY: the Y values of each row
+    @param learner: a learner instance. Learners with partial_fit and remove
+    (IncLinRegLearner) are updated with only the rows that enter and leave the
+    window. Since a linear regression with a constant term gives the same
+    predictions on normalized and raw features, they are fitted on raw features.
+    Other learners are refitted at every step on features normalized by the
+    window's mean and standard deviation, as mean_normalization does.
+    @param step: number of rows predicted between refits
+    @param gap: rows left out between the window and the predicted rows, such
+    as horizon-1 so that no training output overlaps the predicted period.
+    @returns a WALK_DTYPE array with one record per predicted row.
+    """
+    dataX = np.asarray(dataX, dtype=float)
+    dataY = np.asarray(dataY, dtype=float)
+    n = dataX.shape[0]
+    test_start, train_start, train_end = _steps(n, window, step, gap)
+    results = np.zeros(max(n-window-gap, 0), dtype=WALK_DTYPE)
+    results["Row"] = np.arange(window+gap, n)
+    results["Actual"] = dataY[window+gap:]
+
+    incremental = hasattr(learner, "partial_fit") and hasattr(learner, "remove")
+    if not incremental:
+        means, stds = window_stats(dataX, window)
+    fitted_start = fitted_end = None
+    for start, end, test in zip(train_start, train_end, test_start):
+        testX = dataX[test:test+step]
+        if not incremental:
+            learner.addEvidence((dataX[start:end]-means[end])/stds[end], dataY[start:end])
+            pred = learner.query((testX-means[end])/stds[end])
+        else:
+            if fitted_start is None or start >= fitted_end:
+                learner.addEvidence(dataX[start:end], dataY[start:end])
+            else:
+                learner.remove(dataX[fitted_start:start], dataY[fitted_start:start])
+                learner.partial_fit(dataX[fitted_end:end], dataY[fitted_end:end])
+            fitted_start, fitted_end = start, end
+            pred = learner.query(testX)
+        results["Predicted"][test-window-gap:test-window-gap+testX.shape[0]] = pred
+    return results
+
+def walk_forward_linreg(dataX, dataY, window=250, step=1, gap=0):
+    """
+    @summary: Walk-forward linear regression of one or many symbols at once.
+    The X'X and X'y of every window come from running sums of the rows' outer
+    products, and the models of all windows of a symbol are solved together.
+    @param dataX: (rows, features) array, or (symbols, rows, features) for
+    symbols that share a feature layout and dates. Rows with NaNs are left
+    out of the windows they fall in.
+    @param dataY: (rows,) or (symbols, rows) Y values
+    @returns a WALK_DTYPE array, with one row of records per symbol for
+    stacked input.
+    """
+    dataX = np.asarray(dataX, dtype=float)
+    dataY = np.asarray(dataY, dtype=float)
+    if dataX.ndim == 2:
+        return walk_forward_linreg(dataX[None], dataY[None], window, step, gap)[0]
+    symbols, n, d = dataX.shape
+    test_start, train_start, train_end = _steps(n, window, step, gap)
+    # the model fitted before each predicted row
+    fit = np.repeat(np.arange(len(test_start)), step)[:n-window-gap]
+    results = np.zeros((symbols, max(n-window-gap, 0)), dtype=WALK_DTYPE)
+    results["Row"] = np.arange(window+gap, n)
+    results["Actual"] = dataY[:, window+gap:]
+
+    for i in range(symbols):
+        valid = ~(np.isnan(dataX[i]).any(axis=1) | np.isnan(dataY[i]))
+        # a constant shift of the features only moves the constant term, and
+        # keeps the running sums small
+        design = np.ones((n, d+1))
+        design[:, :-1] = dataX[i] - np.nanmean(dataX[i][valid], axis=0)
+        design[~valid] = 0
+        y = np.where(valid, dataY[i], 0)
+        outer = np.zeros((n+1, d+1, d+1))
+        np.cumsum(design[:, :, None]*design[:, None, :], axis=0, out=outer[1:])
+        cross = np.zeros((n+1, d+1))
+        np.cumsum(design*y[:, None], axis=0, out=cross[1:])
+        coefs = solve_normal_equations(outer[train_end]-outer[train_start],
+                                       cross[train_end]-cross[train_start])[fit]
+        testX = design[window+gap:]
+        results["Predicted"][i] = np.einsum("ij,ij->i", testX, coefs)
+        results["Predicted"][i][~valid[window+gap:]] = np.nan
+    return results
@@ -0,0 +1,429 @@
+"""
+Search over sets of indicators.
+
+The columns of every indicator are computed once per symbol into one matrix,
+and each set of indicators is scored on a set of column indices into it
+instead of rebuilding its features. Symbols are spread over a process pool,
+and the scores of every finished symbol are written to a checkpoint folder,
+so an interrupted search picks up where it stopped. The folder is removed
+once the search is done.
+
+For pools too large to try every set, select_indicators searches stepwise
+or with a beam over linear regressions kept as Gram matrices.
+"""
+
+import math
+import os
+import shutil
+from multiprocessing import Pool
+import numpy as np
+
+from dataset_construction import create_input, create_output, _indicator_key, _source_mtime
+from helpers.error_metrics import rmse, mape
+from helpers.normalization import mean_normalization
+
+# the scores of one set of indicators on one symbol, in the order
+# score_dataset returns them
+SCORES = ["Cor", "TrainCor", "TrainMAPE", "TestMAPE", "TrainRMSE", "TestRMSE"]
+
+def score_dataset(data, learner):
+    """Train @learner on the first 60% of the rows of the array @data, features
+    then output, and test it on the rest.
+    Returns the predictions in and out of sample and the SCORES."""
+    # compute how much of the data is training and testing
+    train_rows = int(math.floor(0.6* data.shape[0]))
+
+    # separate out training and testing data
+    trainX = data[:train_rows,0:-1]
+    trainY = data[:train_rows,-1]
+    testX = data[train_rows:,0:-1]
+    testY = data[train_rows:,-1]
+    trainX, testX = mean_normalization(trainX, testX)
+    learner.addEvidence(trainX, trainY) # train it
+
+    # evaluate in sample
+    predYtrain = learner.query(trainX)
+    train_rmse = rmse(trainY, predYtrain)
+    train_mape = mape(trainY, predYtrain)
+    train_cor = np.corrcoef(predYtrain, y=trainY)
+
+    # evaluate out of sample
+    predY = learner.query(testX)
+    test_rmse = rmse(testY,predY)
+    test_mape = mape(testY, predY)
+    c = np.corrcoef(predY, y=testY)
+    return predYtrain, predY, (c[0,1], train_cor[0,1], train_mape, test_mape, train_rmse, test_rmse)
+
+def indicator_matrix(symbol, indicators, horizon=5):
+    """
+    @summary: Compute the columns of all of @indicators for @symbol at once.
+    @returns the (rows, columns) features, the output of each row, the indices
+    of the columns every set of indicators has (the adjusted closes) and the
+    column indices of each indicator.
+    """
+    base = create_input(symbol, indicators=[])
+    dataX = create_input(symbol, indicators=indicators)
+    dataY = create_output(symbol, horizon=horizon, use_prices=False)
+    groups = []
+    start = base.shape[1]
+    for indicator in indicators:
+        width = create_input(symbol, indicators=[indicator]).shape[1] - base.shape[1]
+        groups.append(np.arange(start, start+width))
+        start += width
+    outputs = dataX.join(dataY).values[:,-1]
+    return dataX.values, outputs, np.arange(base.shape[1]), groups
+
+def combination_columns(base, groups, combination):
+    """Column indices of the indicator set @combination, a tuple of indices
+    into @groups, in the order create_input would put them."""
+    return np.concatenate([base] + [groups[i] for i in combination])
+
+def score_combinations(symbol, indicators, combinations, learner, horizon=5):
+    """
+    @summary: Score every set of indicators in @combinations on @symbol, as
+    testindicator.run_test would.
+    @param combinations: tuples of indices into @indicators
+    @returns a (combinations, SCORES) array. Sets that could not be fitted
+    (such as ones with infinite values) are NaN.
+    """
+    dataX, dataY, base, groups = indicator_matrix(symbol, indicators, horizon)
+    # run_test drops the rows with NaNs in the columns of its set only
+    valid = ~np.isnan(dataX)
+    valid_y = ~np.isnan(dataY)
+    scores = np.full((len(combinations), len(SCORES)), np.nan)
+    for i, combination in enumerate(combinations):
+        cols = combination_columns(base, groups, combination)
+        rows = np.flatnonzero(valid[:,cols].all(axis=1) & valid_y)
+        # laid out by column like DataFrame.values, since the least squares fit of
+        # collinear sets (such as Weekdays with the constant) depends on the layout
+        data = np.empty((rows.shape[0], cols.shape[0]+1), order="F")
+        data[:,:-1] = dataX[np.ix_(rows, cols)]
+        data[:,-1] = dataY[rows]
+        try:
+            scores[i] = score_dataset(data, learner)[2]
+        except ValueError:
+            continue
+        except Exception, e:
+            print str(e)
+    return scores
+
+def _score_task(args):
+    symbol, indicators, combinations, learner, horizon = args
+    try:
+        return symbol, score_combinations(symbol, indicators, combinations, learner, horizon)
+    except Exception, e:
+        print str(e)
+        return symbol, np.full((len(combinations), len(SCORES)), np.nan)
+
+def _learner_key(learner):
+    # the learner's settings, not anything it was trained on
+    params = sorted((k, v) for k, v in vars(learner).items()
+                    if isinstance(v, (bool, int, long, float, str, type(None))))
+    return (learner.__class__.__name__, tuple(params))
+
+def _open_checkpoint(checkpoint, key):
+    """Create the @checkpoint folder, or reuse it if it was written for the
+    same search, given as lines of text in @key. Returns the scores of the
+    symbols already done whose data has not changed since."""
+    listing = os.path.join(checkpoint, "search.txt")
+    if os.path.exists(listing):
+        with open(listing) as fhand:
+            if fhand.read().splitlines() != key:
+                # left by an unfinished search of something else
+                shutil.rmtree(checkpoint)
+    if not os.path.isdir(checkpoint):
+        os.makedirs(checkpoint)
+        with open(listing, "w") as fhand:
+            fhand.write("\n".join(key) + "\n")
+    done = {}
+    for filename in os.listdir(checkpoint):
+        if filename.endswith(".npy") and not filename.endswith(".tmp.npy"):
+            symbol, path = filename[:-4], os.path.join(checkpoint, filename)
+            if _source_mtime(symbol) <= os.path.getmtime(path):
+                done[symbol] = np.load(path)
+    return done
+
+def _save_checkpoint(checkpoint, symbol, scores):
+    # written under another name first, so a killed search never leaves half a file
+    filename = os.path.join(checkpoint, symbol + ".npy")
+    np.save(filename + ".tmp.npy", scores)
+    os.rename(filename + ".tmp.npy", filename)
+
+def search_combinations(symbols, indicators, combinations, learner, processes=None,
+                        checkpoint=None, horizon=5):
+    """
+    @summary: Score sets of indicators on many symbols.
+    @param indicators: the indicators the sets are drawn from
+    @param combinations: tuples of indices into @indicators, one per set
+    @param learner: learner instance, copied to each worker
+    @param processes: size of the process pool, one per cpu by default. 1 runs
+    in this process.
+    @param checkpoint: optional folder the scores of each finished symbol are
+    saved to while searching. Symbols saved there by an interrupted run of the
+    same search are not scored again, unless their data changed since.
+    @returns a (symbols, combinations, SCORES) array, NaN where a set could not
+    be scored on a symbol.
+    """
+    names = [", ".join(indicators[i].name for i in combination) for combination in combinations]
+    done = {}
+    if checkpoint:
+        key = ["horizon {}".format(horizon), repr(_learner_key(learner))]
+        key += [repr(_indicator_key(indicator)) for indicator in indicators]
+        done = _open_checkpoint(checkpoint, key + names)
+    tasks = [(symbol, indicators, combinations, learner, horizon)
+             for symbol in symbols if symbol not in done]
+    if processes == 1:
+        results = (_score_task(task) for task in tasks)
+    else:
+        pool = Pool(processes)
+        results = pool.imap_unordered(_score_task, tasks)
+    try:
+        for symbol, scores in results:
+            done[symbol] = scores
+            if checkpoint:
+                _save_checkpoint(checkpoint, symbol, scores)
+    finally:
+        # every symbol is done by now, unless the search was interrupted
+        if processes != 1:
+            pool.terminate()
+            pool.join()
+    if checkpoint:
+        shutil.rmtree(checkpoint)
+    return np.array([done[symbol] for symbol in symbols]).reshape(len(symbols), len(combinations), len(SCORES))
+
+def symbol_gram(symbol, indicators, horizon=5):
+    """
+    @summary: Prepare the linear regressions of every set of @indicators on
+    @symbol to be fit from Gram matrices. Like run_test, a set is fit on the
+    rows its own columns have values on, so row_gram builds the matrices of
+    each such set of rows as a search comes to it.
+    @returns a dict with the features and outputs, the columns of each
+    indicator and the rows it has values on, and which indicators have only
+    finite values (Lag of returns can be infinite).
+    """
+    dataX, dataY, base, groups = indicator_matrix(symbol, indicators, horizon)
+    finite = np.array([np.isfinite(dataX[:,g][~np.isnan(dataX[:,g])]).all() for g in groups])
+    # the values may be shared with the dataset cache
+    dataX = dataX.copy()
+    for i in np.flatnonzero(~finite):
+        dataX[:,groups[i]] = 0
+    valid = ~np.isnan(dataX)
+    return {"X": dataX, "y": dataY, "base": base, "groups": groups, "finite": finite,
+            "base_rows": valid[:,base].all(axis=1) & ~np.isnan(dataY),
+            "rows": [valid[:,g].all(axis=1) for g in groups], "grams": {}}
+
+def row_gram(problem, rows):
+    """The Gram matrices of the rows @rows of @problem. They are split 60/40
+    into training and testing rows, as score_dataset does, and centered on the
+    training means so the constant term drops out. Kept in the problem for the
+    next set on the same rows."""
+    key = rows.tostring()
+    if key not in problem["grams"]:
+        dataX, dataY = problem["X"][rows], problem["y"][rows]
+        train_rows = int(math.floor(0.6* dataX.shape[0]))
+        means = dataX[:train_rows].mean(axis=0)
+        trainX, testX = dataX[:train_rows] - means, dataX[train_rows:] - means
+        trainY, testY = dataY[:train_rows] - dataY[:train_rows].mean(), dataY[train_rows:] - dataY[:train_rows].mean()
+        problem["grams"][key] = {
+            "gram": np.dot(trainX.T, trainX), "cross": np.dot(trainX.T, trainY),
+            "test_gram": np.dot(testX.T, testX), "test_cross": np.dot(testX.T, testY),
+            "test_yy": np.dot(testY, testY), "test_rows": testX.shape[0]}
+    return problem["grams"][key]
+
+def _gram_task(args):
+    symbol, indicators, horizon = args
+    try:
+        return symbol, symbol_gram(symbol, indicators, horizon)
+    except Exception, e:
+        print str(e)
+        return symbol, None
+
+class GramFit(object):
+    """Least squares fit of a set of indicators on one symbol, kept as the
+    inverse of the training Gram matrix of its columns. A column is added by
+    bordering the inverse and removed by downdating it, both in O(d^2).
+    Columns that are linear combinations of the ones in the fit (such as the
+    fifth weekday) add nothing to it; they are set aside and tried again when
+    columns leave. The fit starts from the adjusted closes alone."""
+
+    def __init__(self, problem):
+        self.problem = problem
+        self._refit(())
+
+    def _refit(self, groups):
+        # fit the columns of @groups from scratch, on the rows they have values on
+        self.groups = tuple(groups)
+        self.rows = self._rows(self.groups)
+        self.gram = row_gram(self.problem, self.rows)
+        self.cols = []
+        self.dependent = []
+        self.inv = np.zeros((0, 0))
+        for col in combination_columns(self.problem["base"], self.problem["groups"], self.groups):
+            self.add(col)
+
+    def _rows(self, groups):
+        rows = self.problem["base_rows"].copy()
+        for group in groups:
+            rows &= self.problem["rows"][group]
+        return rows
+
+    def copy(self):
+        fit = GramFit.__new__(GramFit)
+        fit.problem = self.problem
+        fit.groups = self.groups
+        fit.rows = self.rows
+        fit.gram = self.gram
+        fit.cols = list(self.cols)
+        fit.dependent = list(self.dependent)
+        fit.inv = self.inv.copy()
+        return fit
+
+    def change(self, group, add=True):
+        """Add or remove the columns of indicator @group. If that changes the
+        rows the set has values on, the fit is rebuilt on the new rows."""
+        if add:
+            groups = self.groups + (group,)
+        else:
+            groups = tuple(g for g in self.groups if g != group)
+        if not np.array_equal(self._rows(groups), self.rows):
+            self._refit(groups)
+            return
+        for col in self.problem["groups"][group]:
+            if add:
+                self.add(col)
+            else:
+                self.remove(col)
+        self.groups = groups
+
+    def add(self, col):
+        gram = self.gram["gram"]
+        q = gram[self.cols, col]
+        u = np.dot(self.inv, q)
+        schur = gram[col, col] - np.dot(q, u)
+        if not schur > 1e-10*gram[col, col]:
+            self.dependent.append(col)
+            return
+        d = len(self.cols)
+        inv = np.empty((d+1, d+1))
+        inv[:d,:d] = self.inv + np.outer(u, u)/schur
+        inv[:d,d] = inv[d,:d] = -u/schur
+        inv[d,d] = 1/schur
+        self.inv = inv
+        self.cols.append(col)
+
+    def remove(self, col):
+        if col in self.dependent:
+            self.dependent.remove(col)
+            return
+        i = self.cols.index(col)
+        keep = np.arange(len(self.cols)) != i
+        g = self.inv[keep, i]
+        self.inv = self.inv[np.ix_(keep, keep)] - np.outer(g, g)/self.inv[i, i]
+        del self.cols[i]
+        dependent, self.dependent = self.dependent, []
+        for c in dependent:
+            self.add(c)
+
+    def test_rmse(self):
+        """Testing RMSE of the fit, from the testing Gram matrix."""
+        p = self.gram
+        coefs = np.dot(self.inv, p["cross"][self.cols])
+        sse = (p["test_yy"] - 2*np.dot(coefs, p["test_cross"][self.cols])
+               + np.dot(coefs, np.dot(p["test_gram"][np.ix_(self.cols, self.cols)], coefs)))
+        return math.sqrt(max(sse, 0)/p["test_rows"])
+
+def _with(fits, group, add=True):
+    """Copies of @fits with indicator @group added or removed."""
+    fits = [fit.copy() for fit in fits]
+    for fit in fits:
+        fit.change(group, add)
+    return fits
+
+def _error(fits, chosen):
+    """The Error of average_*_best.csv for the set @chosen, the testing RMSE
+    summed over the symbols it is below 4.0 on. Like the exhaustive search, a
+    symbol on which an indicator of the set has infinite values can not be
+    fitted and is left out. None if no symbol is left."""
+    errors = [fit.test_rmse() for fit in fits
+              if all(fit.problem["finite"][group] for group in chosen)]
+    errors = [error for error in errors if error < 4.0]
+    return sum(errors) if errors else None
+
+def select_indicators(symbols, indicators, mode="forward", max_size=5, width=5,
+                      processes=None, horizon=5):
+    """
+    @summary: Search for good sets of indicators without trying every set.
+    "forward" starts from no indicator and adds the one that lowers the error
+    most, "backward" starts from all of them and removes the one whose removal
+    lowers it most, both until no step lowers it. "beam" keeps the @width best
+    sets of each size and extends each by one indicator.
+    @param max_size: largest set tried by forward and beam search
+    @param processes: size of the pool the Gram matrices are computed over
+    @returns a dict from each set tried (a tuple of indices into @indicators)
+    to its Error, as _error sums it. Sets no symbol could be fitted on are left
+    out, as they are from average_*_best.csv.
+    """
+    if mode not in ("forward", "backward", "beam"):
+        raise ValueError("Unknown search mode {}".format(mode))
+    tasks = [(symbol, indicators, horizon) for symbol in symbols]
+    if processes == 1:
+        results = [_gram_task(task) for task in tasks]
+    else:
+        pool = Pool(processes)
+        try:
+            results = pool.map(_gram_task, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    problems = [problem for _, problem in results if problem is not None]
+    candidates = range(len(indicators))
+    tried = {}
+    def score(fits, chosen):
+        error = _error(fits, chosen)
+        if error is None:
+            # ranks last, but the search can still step through it
+            return float("inf")
+        if chosen:
+            tried[chosen] = error
+        return error
+
+    start = [GramFit(p) for p in problems]
+    if mode == "backward":
+        fits = start
+        for group in candidates:
+            fits = _with(fits, group)
+        chosen = tuple(candidates)
+        error = score(fits, chosen)
+        while len(chosen) > 1:
+            steps = []
+            for group in chosen:
+                new_set = tuple(i for i in chosen if i != group)
+                new_fits = _with(fits, group, add=False)
+                steps.append((score(new_fits, new_set), new_set, new_fits))
+            new_error, new_set, new_fits = min(steps, key=lambda step: step[0])
+            # a set no symbol could be fitted on is always stepped away from
+            if new_error >= error and error != float("inf"):
+                break
+            chosen, fits, error = new_set, new_fits, new_error
+        return tried
+
+    # forward search is a beam search one set wide that stops once no
+    # indicator lowers the error
+    beam = [((), start, score(start, ()))]
+    for size in range(1, max_size+1):
+        extended = {}
+        for chosen, fits, error in beam:
+            for group in candidates:
+                new_set = tuple(sorted(chosen + (group,)))
+                if group in chosen or new_set in extended:
+                    continue
+                new_fits = _with(fits, group)
+                extended[new_set] = (new_set, new_fits, score(new_fits, new_set))
+        ranked = sorted(extended.values(), key=lambda step: step[2])
+        if mode == "forward":
+            if not ranked or ranked[0][2] >= beam[0][2]:
+                break
+            beam = ranked[:1]
+        else:
+            beam = ranked[:width]
+    return tried
@@ -1,19 +1,43 @@
 import numpy as np
 import pandas as pd
+from panel import like_input
+from intermediates import Intermediates
+from streaming import RollingSums, bar_values, indicator_row, history
 
 class Bollinger(object):
     def __init__(self, window=20):
         self.window = window
         self.name = "Bollinger_{}".format(window)
+        self._state = None
 
     def addEvidence(self, data):
         self.data = data
+        self._state = None
 
-    def getIndicator(self):
-        mva = pd.rolling_mean(self.data, self.window)
-        sd = pd.rolling_std(self.data, self.window)
-        boll = (self.data - mva) / (2*sd)
+    def requires(self):
+        return [("rolling_mean", "data", self.window), ("rolling_std", "data", self.window)]
+
+    def getIndicator(self, shared=None):
+        """@param shared: optional Intermediates of the data, shared with other indicators"""
+        if shared is None:
+            shared = Intermediates(self.data)
+        data = shared.data
+        mva = shared.rolling_mean(self.window)
+        sd = shared.rolling_std(self.window)
+        boll = (data - mva) / (2*sd)
         
         boll.columns = [self.name+"_"+x for x in boll.columns]
 
-        return boll
+        return like_input(boll, self.data)
+
+    def update(self, new_bar):
+        """Returns the indicator of a bar that follows the data, from running
+        sums of the last window bars and their squares."""
+        if self._state is None:
+            data = history(self, new_bar)
+            self._columns = list(data.columns)
+            self._state = RollingSums(self.window, len(self._columns), data.values)
+        values, date = bar_values(new_bar, self._columns)
+        self._state.push(values)
+        boll = (values - self._state.mean()) / (2*self._state.std())
+        return indicator_row(boll, [self.name+"_"+x for x in self._columns], date)
@@ -1,16 +1,49 @@
 import numpy as np
 import pandas as pd
+from panel import like_input
+from intermediates import Intermediates
+from streaming import bar_values, indicator_row, history
 
 class ExponentialMA(object):
     def __init__(self, window=20):
         self.window = window
         self.name = "EMA_{}".format(window)
+        self._state = None
 
     def addEvidence(self, data):
         self.data = data
+        self._state = None
 
-    def getIndicator(self):
-        ema = self.data/pd.ewma(self.data, span=self.window) - 1
+    def requires(self):
+        return [("ewm", "data", self.window)]
+
+    def getIndicator(self, shared=None):
+        """@param shared: optional Intermediates of the data, shared with other indicators"""
+        if shared is None:
+            shared = Intermediates(self.data)
+        data = shared.data
+        ema = data/shared.ewm(self.window) - 1
         ema.columns = [self.name+"_"+x for x in ema.columns]
 
-        return ema
+        return like_input(ema, self.data)
+
+    def update(self, new_bar):
+        """Returns the indicator of a bar that follows the data. pd.ewma weighs
+        the bar k bars back by (1-alpha)**k, so its numerator and denominator
+        are updated recursively."""
+        decay = 1 - 2.0/(self.window+1)
+        if self._state is None:
+            data = history(self, new_bar)
+            self._columns = list(data.columns)
+            weights = decay**np.arange(data.shape[0]-1, -1, -1)[:,None]
+            valid = ~np.isnan(data.values)
+            self._state = [(weights*np.where(valid, data.values, 0)).sum(axis=0),
+                           (weights*valid).sum(axis=0)]
+        values, date = bar_values(new_bar, self._columns)
+        valid = ~np.isnan(values)
+        num = self._state[0]*decay + np.where(valid, values, 0)
+        den = self._state[1]*decay + valid
+        self._state = [num, den]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ema = values/(num/den) - 1
+        return indicator_row(ema, [self.name+"_"+x for x in self._columns], date)
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+from panel import as_frame, like_input
+
+KINDS = ("SMA", "Bollinger", "Volatility", "Momentum", "Lag")
+# the indicator class of each kind, and the prefix of its column names
+CLASSES = {"SimpleMA": "SMA", "Bollinger": "Bollinger", "Volatility": "Volatility",
+           "Momentum": "Momentum", "Lag": "Lag"}
+PREFIXES = {"SMA": "SMA_{}_", "Bollinger": "Bollinger_{}_", "Volatility": "Volatility_{}_",
+            "Momentum": "Momentum_{}_", "Lag": "Lag{}_"}
+
+def block_sums(values, block):
+    """Cumulative sums of @values restarted every @block rows, and the total of
+    each block. Sums over at most @block rows come from these with the rounding
+    error of a few rows rather than of the whole series."""
+    rows = values.shape[0]
+    blocks = -(-rows // block)
+    padded = np.zeros((blocks*block,) + values.shape[1:])
+    padded[:rows] = values
+    local = np.cumsum(padded.reshape((blocks, block) + values.shape[1:]), axis=1)
+    return local.reshape(padded.shape)[:rows], local[:, -1]
+
+def window_sum(local, totals, block, window):
+    """Sums of the @window rows ending at each row from window-1 on, from the
+    output of block_sums. A window spans at most two blocks."""
+    end = np.arange(window-1, local.shape[0])
+    start = end - window + 1
+    # the local sum before the window's first row, in that row's block
+    before = np.where((start % block != 0)[:,None], local[np.maximum(start-1, 0)], 0)
+    crossed = (start // block != end // block)[:,None]
+    return local[end] - before + np.where(crossed, totals[start // block], 0)
+
+def window_stats(values, windows):
+    """Rolling means and sample standard deviations of the columns of @values
+    for every window in @windows, all taken from one blocked cumulative sum of
+    the values and one of their squares. Returns two (windows, rows, columns)
+    arrays that are NaN, like pd.rolling_mean and pd.rolling_std, until a
+    window is full and while it holds a NaN or inf. Like those, a window of
+    one repeated value has exactly that mean and a deviation of 0."""
+    rows, columns = values.shape
+    finite = np.isfinite(values)
+    # sums are taken around each column's mean so the squares stay small
+    with np.errstate(invalid="ignore"):
+        ref = np.where(finite.any(axis=0), np.nanmean(np.where(finite, values, np.nan), axis=0), 0)
+    centered = np.where(finite, values - ref, 0)
+    block = max(windows)
+    sums = block_sums(centered, block)
+    sq_sums = block_sums(centered**2, block)
+    bad = block_sums((~finite).astype(float), block)
+    # where each value differs from the one before, to find windows of one value
+    changes = np.zeros(values.shape)
+    changes[1:] = values[1:] != values[:-1]
+    changed = block_sums(changes, block)
+
+    means = np.full((len(windows), rows, columns), np.nan)
+    stds = np.full((len(windows), rows, columns), np.nan)
+    for i, w in enumerate(windows):
+        if w > rows:
+            continue
+        s = window_sum(sums[0], sums[1], block, w)
+        ok = window_sum(bad[0], bad[1], block, w) == 0
+        var = (window_sum(sq_sums[0], sq_sums[1], block, w) - s**2/w)/max(w-1, 1)
+        same = np.ones(s.shape, dtype=bool)
+        if w > 1:
+            same = window_sum(changed[0], changed[1], block, w-1)[1:] == 0
+        means[i, w-1:] = np.where(ok, np.where(same, values[w-1:], ref + s/w), np.nan)
+        stds[i, w-1:] = np.where(ok, np.where(same, 0, np.sqrt(np.maximum(var, 0))), np.nan)
+    return means, stds
+
+class IndicatorBank(object):
+    def __init__(self, kinds=KINDS, windows=range(2,21)):
+        """
+        A family of indicators for many windows at once: SimpleMA, Bollinger,
+        Volatility, Momentum and Lag for every window in @windows. The rolling
+        statistics of all windows come from shared cumulative sums instead of
+        one rolling pass per indicator and window.
+        """
+        self.kinds = tuple(kinds)
+        self.windows = tuple(windows)
+        self.name = "Bank_{}_{}-{}".format("_".join(self.kinds), min(self.windows), max(self.windows))
+
+    def addEvidence(self, data):
+        self.data = data
+
+    def getBank(self):
+        """Returns the indicators as one contiguous (rows, kinds, windows) array,
+        or (rows, kinds, windows, columns) when the data has several columns.
+        For a symbols x dates panel it is (symbols, dates, kinds, windows)."""
+        data = as_frame(self.data)
+        values = data.values.astype(float)
+        rows, columns = values.shape
+        bank = np.full((len(self.kinds), len(self.windows), rows, columns), np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if "SMA" in self.kinds or "Bollinger" in self.kinds:
+                means, stds = window_stats(values, self.windows)
+            if "SMA" in self.kinds:
+                bank[self.kinds.index("SMA")] = values/means - 1
+            if "Bollinger" in self.kinds:
+                bank[self.kinds.index("Bollinger")] = (values - means) / (2*stds)
+            if "Volatility" in self.kinds:
+                returns = np.full(values.shape, np.nan)
+                returns[1:] = values[1:]/values[:-1] - 1
+                _, vol = window_stats(returns, self.windows)
+                bank[self.kinds.index("Volatility")] = vol * np.sqrt(252)
+            if "Momentum" in self.kinds:
+                mom = bank[self.kinds.index("Momentum")]
+                for i, w in enumerate(self.windows):
+                    mom[i, w:] = values[w:]/values[:-w] - 1
+            if "Lag" in self.kinds:
+                # shifting the data and then taking pct_change is the same as the reverse
+                pct = data.pct_change().values
+                lag = bank[self.kinds.index("Lag")]
+                for i, w in enumerate(self.windows):
+                    lag[i, w:] = pct[:-w]
+        if isinstance(self.data, np.ndarray):
+            return np.ascontiguousarray(bank.transpose(3, 2, 0, 1))
+        bank = np.ascontiguousarray(bank.transpose(2, 0, 1, 3))
+        return bank[..., 0] if columns == 1 else bank
+
+    def column_names(self):
+        """Names of the bank's columns in getIndicator, which are the names the
+        single indicators give them."""
+        return [PREFIXES[kind].format(w)+x
+                for kind in self.kinds for w in self.windows for x in self.data.columns]
+
+    def prefix(self, indicator):
+        """Returns the prefix of the bank's columns that hold @indicator, such as
+        "SMA_5_" for SimpleMA(5)."""
+        kind = CLASSES.get(type(indicator).__name__)
+        if kind not in self.kinds or indicator.window not in self.windows:
+            raise KeyError("{} is not in {}".format(indicator.name, self.name))
+        return PREFIXES[kind].format(indicator.window)
+
+    def getIndicator(self):
+        if isinstance(self.data, np.ndarray):
+            return self.getBank()
+        bank = self.getBank()
+        return pd.DataFrame(bank.reshape(self.data.shape[0], -1),
+                            index=self.data.index, columns=self.column_names())
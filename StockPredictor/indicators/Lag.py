@@ -1,17 +1,49 @@
 import numpy as np
 import pandas as pd
+from panel import like_input
+from intermediates import Intermediates
+from streaming import RingBuffer, bar_values, indicator_row, history
 
 class Lag(object):
     def __init__(self, window=1):
         self.window = window
         self.name = "Lag_{}".format(window)
+        self._state = None
 
     def addEvidence(self, data):
         self.data = data
+        self._state = None
 
-    def getIndicator(self):
-    	lag = self.data.shift(self.window).pct_change()
+    def requires(self):
+        return [("pct_change",)]
+
+    def getIndicator(self, shared=None):
+        """@param shared: optional Intermediates of the data, shared with other indicators"""
+        if shared is None:
+            shared = Intermediates(self.data)
+        # the change of the data shifted by window is the shifted change of the data
+        lag = shared.pct_change().shift(self.window)
 
         lag.columns = ["Lag{}_".format(self.window)+x for x in lag.columns]
 
-        return lag
+        return like_input(lag, self.data)
+
+    def update(self, new_bar):
+        """Returns the indicator of a bar that follows the data, from a ring
+        buffer of the last window+1 bars. Like pct_change, missing values are
+        filled with the last known one, and give NaN themselves."""
+        if self._state is None:
+            data = history(self, new_bar)
+            self._columns = list(data.columns)
+            # each row holds the filled values, then which of them were missing
+            self._state = RingBuffer(self.window+1, 2*len(self._columns),
+                                     np.hstack([data.fillna(method="pad").values, data.isnull().values]))
+        values, date = bar_values(new_bar, self._columns)
+        n = len(self._columns)
+        missing = np.isnan(values)
+        previous = self._state.push(np.hstack([np.where(missing, self._state.get(0)[:n], values), missing]))
+        if previous is None:
+            previous = np.full(2*n, np.nan)
+        lagged = self._state.get(self.window)
+        lag = np.where(lagged[n:] == 1, np.nan, lagged[:n]/previous[:n] - 1)
+        return indicator_row(lag, ["Lag{}_".format(self.window)+x for x in self._columns], date)
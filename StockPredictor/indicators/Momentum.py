@@ -1,16 +1,36 @@
 import numpy as np
 import pandas as pd
+from panel import as_frame, like_input
+from streaming import RingBuffer, bar_values, indicator_row, history
 
 class Momentum(object):
     def __init__(self, window=5):
         self.window = window
         self.name = "Momentum_{}".format(window)
+        self._state = None
 
     def addEvidence(self, data):
         self.data = data
+        self._state = None
 
     def getIndicator(self):
-    	mom = (self.data/self.data.shift(self.window)) - 1
+        data = as_frame(self.data)
+    	mom = (data/data.shift(self.window)) - 1
         mom.columns = [self.name+"_"+x for x in mom.columns]
 
-        return mom
+        return like_input(mom, self.data)
+
+    def update(self, new_bar):
+        """Returns the indicator of a bar that follows the data, from a ring
+        buffer of the last window bars."""
+        if self._state is None:
+            data = history(self, new_bar)
+            self._columns = list(data.columns)
+            self._state = RingBuffer(self.window, len(self._columns), data.values)
+        values, date = bar_values(new_bar, self._columns)
+        # the bar pushed out is the one window bars back
+        previous = self._state.push(values)
+        if previous is None:
+            previous = np.nan
+        mom = (values/previous) - 1
+        return indicator_row(mom, [self.name+"_"+x for x in self._columns], date)
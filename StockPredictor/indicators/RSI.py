@@ -1,21 +1,123 @@
 import numpy as np
 import pandas as pd
+from panel import like_input
+from intermediates import Intermediates
+from streaming import RollingSums, bar_values, indicator_row, history
+
+def rolling_sum(values, window):
+    """Sums of every @window consecutive rows of @values (rows, ...) from one
+    cumulative sum. The first window-1 rows are NaN, as for pd.rolling_apply.
+    Windows without a nonzero value are exactly 0."""
+    sums = np.cumsum(values, axis=0)
+    sums[window:] = sums[window:] - sums[:-window]
+    nonzero = np.cumsum(values != 0, axis=0)
+    nonzero[window:] = nonzero[window:] - nonzero[:-window]
+    sums[nonzero == 0] = 0
+    sums[:window-1] = np.nan
+    return sums
+
+def wilder_average(values, window, start=None):
+    """Wilder's smoothing of the rows of @values: the mean of the first window
+    rows, then avg = avg + (value - avg)/window for every later row.
+    @start: optional row each column starts at, such as a symbol's first price."""
+    seeded = np.array(values, dtype=float).reshape(values.shape[0], -1)
+    if start is None:
+        start = np.zeros(seeded.shape[1], dtype=int)
+    seed_rows = np.asarray(start) + window - 1
+    for col, row in enumerate(seed_rows):
+        if row < seeded.shape[0]:
+            seeded[row, col] = seeded[row-window+1:row+1, col].mean()
+    seeded[np.arange(seeded.shape[0])[:,None] < seed_rows] = np.nan
+    avg = pd.ewma(pd.DataFrame(seeded), alpha=1.0/window, adjust=False).values
+    return avg.reshape(values.shape)
+
+def rsi(gain, window, wilder=False, start=None):
+    """RSI of every column of @gain, an array of price changes with one row per
+    bar. The average gain and loss are the sums of the gains and losses in the
+    last @window rows divided by window, or their Wilder averages.
+    @start: optional row each column starts at, such as a symbol's first price
+    in a panel. Rows before start+window-1 are NaN."""
+    gain = np.asarray(gain, dtype=float)
+    up = np.clip(gain, 0, None)
+    down = np.clip(-gain, 0, None)
+    if wilder:
+        avg_gain = wilder_average(up, window, start)
+        avg_loss = wilder_average(down, window, start)
+    else:
+        avg_gain = rolling_sum(up, window)/window
+        avg_loss = rolling_sum(down, window)/window
+    with np.errstate(invalid="ignore", divide="ignore"):
+        values = 100 - 100/(1+avg_gain/avg_loss)
+    if start is not None:
+        rows = np.arange(gain.shape[0]).reshape((-1,) + (1,)*(gain.ndim-1))
+        values[rows < np.asarray(start) + window - 1] = np.nan
+    return values
 
 class RSI(object):
-    def __init__(self, window=14):
+    def __init__(self, window=14, wilder=False):
+        """
+        @param wilder: average gains and losses with Wilder's smoothing, seeded
+        with their mean over the first window bars, instead of over the last
+        window bars only.
+        """
         self.window = window
+        self.wilder = wilder
         self.name = "RSI_{}".format(window)
+        self._state = None
 
     def addEvidence(self, data):
         self.data = data
+        self._state = None
         
-    def getIndicator(self):
-        gain = (self.data-self.data.shift(1)).fillna(0)
+    def requires(self):
+        return [("diff",)]
+
+    def getIndicator(self, shared=None):
+        """@param shared: optional Intermediates of the data, shared with other indicators"""
+        if shared is None:
+            shared = Intermediates(self.data)
+        data = shared.data
+        gain = shared.diff().fillna(0)
         gain.columns = ["RSI_{}".format(self.window) for x in gain.columns]
-        return pd.rolling_apply(gain, self.window , self.rsi_calc)
+        # symbols of a panel start at their first price
+        start = data.notnull().values.argmax(axis=0)
+        # all columns at once, without a python call per row
+        return like_input(pd.DataFrame(rsi(gain.values, self.window, self.wilder, start),
+                                       index=gain.index, columns=gain.columns), self.data)
 
     def rsi_calc(self, prices):
         avg_gain = prices[prices>0].sum()/self.window
         avg_loss = -prices[prices<0].sum()/self.window
         rs = avg_gain/avg_loss
         return 100 - 100/(1+rs)
+
+    def update(self, new_bar):
+        """Returns the indicator of a bar that follows the data, from running
+        sums of the gains and losses of the last window bars (or from the
+        Wilder averages)."""
+        if self._state is None:
+            data = history(self, new_bar)
+            self._columns = list(data.columns)
+            gain = (data-data.shift(1)).fillna(0).values
+            # the first window bars seed the Wilder averages
+            self._state = RollingSums(self.window, 2*len(self._columns),
+                                      np.hstack([gain.clip(min=0), -gain.clip(max=0)]))
+            self._seen = gain.shape[0]
+            self._last = data.values[-1] if data.shape[0] else np.full(len(self._columns), np.nan)
+            if self.wilder and self._seen >= self.window:
+                self._avg = np.hstack([wilder_average(gain.clip(min=0), self.window)[-1],
+                                       wilder_average(-gain.clip(max=0), self.window)[-1]])
+        values, date = bar_values(new_bar, self._columns)
+        gain = np.nan_to_num(values - self._last)
+        self._last = values
+        gains = np.hstack([gain.clip(min=0), -gain.clip(max=0)])
+        self._seen += 1
+        if not self.wilder or self._seen <= self.window:
+            self._state.push(gains)
+            self._avg = self._state.mean()
+        else:
+            self._avg = self._avg + (gains - self._avg)/self.window
+        n = len(self._columns)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rsi = 100 - 100/(1+self._avg[:n]/self._avg[n:])
+        return indicator_row(rsi, ["RSI_{}".format(self.window) for x in self._columns], date)
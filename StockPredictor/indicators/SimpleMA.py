@@ -1,16 +1,40 @@
 import numpy as np
 import pandas as pd
+from panel import like_input
+from intermediates import Intermediates
+from streaming import RollingSums, bar_values, indicator_row, history
 
 class SimpleMA(object):
     def __init__(self, window=20):
         self.window = window
         self.name = "SMA_{}".format(window)
+        self._state = None
 
     def addEvidence(self, data):
         self.data = data
+        self._state = None
 
-    def getIndicator(self):
-        sma = self.data/pd.rolling_mean(self.data, self.window) - 1
+    def requires(self):
+        return [("rolling_mean", "data", self.window)]
+
+    def getIndicator(self, shared=None):
+        """@param shared: optional Intermediates of the data, shared with other indicators"""
+        if shared is None:
+            shared = Intermediates(self.data)
+        data = shared.data
+        sma = data/shared.rolling_mean(self.window) - 1
         sma.columns = [self.name+"_"+x for x in sma.columns]
 
-        return sma
+        return like_input(sma, self.data)
+
+    def update(self, new_bar):
+        """Returns the indicator of a bar that follows the data, from a running
+        sum of the last window bars."""
+        if self._state is None:
+            data = history(self, new_bar)
+            self._columns = list(data.columns)
+            self._state = RollingSums(self.window, len(self._columns), data.values)
+        values, date = bar_values(new_bar, self._columns)
+        self._state.push(values)
+        sma = values/self._state.mean() - 1
+        return indicator_row(sma, [self.name+"_"+x for x in self._columns], date)
@@ -1,18 +1,43 @@
 import numpy as np
 import pandas as pd
+from panel import like_input
+from intermediates import Intermediates
+from streaming import RollingSums, bar_values, indicator_row, history
 
 class Volatility(object):
     def __init__(self, window=20):
         self.window = window
         self.name = "Volatility_{}".format(window)
+        self._state = None
 
     def addEvidence(self, data):
         self.data = data
+        self._state = None
 
-    def getIndicator(self):
-    	returns = self.data/self.data.shift(1) - 1
-        vol = pd.rolling_std(returns, self.window) * np.sqrt(252)
+    def requires(self):
+        return [("rolling_std", "returns", self.window)]
+
+    def getIndicator(self, shared=None):
+        """@param shared: optional Intermediates of the data, shared with other indicators"""
+        if shared is None:
+            shared = Intermediates(self.data)
+        vol = shared.rolling_std(self.window, source="returns") * np.sqrt(252)
 
         vol.columns = [self.name+"_"+x for x in vol.columns]
 
-        return vol
+        return like_input(vol, self.data)
+
+    def update(self, new_bar):
+        """Returns the indicator of a bar that follows the data, from running
+        sums of the last window returns and their squares."""
+        if self._state is None:
+            data = history(self, new_bar)
+            self._columns = list(data.columns)
+            returns = data/data.shift(1) - 1
+            self._state = RollingSums(self.window, len(self._columns), returns.values)
+            self._last = data.values[-1] if data.shape[0] else np.full(len(self._columns), np.nan)
+        values, date = bar_values(new_bar, self._columns)
+        self._state.push(values/self._last - 1)
+        self._last = values
+        vol = self._state.std() * np.sqrt(252)
+        return indicator_row(vol, [self.name+"_"+x for x in self._columns], date)
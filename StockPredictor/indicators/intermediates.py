@@ -0,0 +1,130 @@
+"""
+Intermediate values that several indicators compute from the same data.
+
+Indicators list the intermediates they read in requires(), as tuples such as
+("rolling_mean", "data", 20) for the 20 bar rolling mean of the data, or
+("rolling_std", "returns", 10) for the 10 bar rolling deviation of its daily
+returns. A set of indicators resolves to the intermediates behind all of them
+with plan(), and compute_indicators computes each of those once and shares
+it through an Intermediates given to every getIndicator.
+"""
+
+import pandas as pd
+from panel import as_frame
+
+DATA = ("data",)
+
+def _one_value(source, window):
+    """Where the @window rows ending at each row all hold the same value."""
+    if window == 1:
+        return pd.DataFrame(True, index=source.index, columns=source.columns)
+    changed = (source != source.shift(1)).astype(float)
+    return pd.rolling_sum(changed, window-1) == 0
+
+def _compute(node, shared):
+    kind = node[0]
+    if kind == "returns":
+        data = shared.data
+        return data/data.shift(1) - 1
+    if kind == "diff":
+        return shared.data - shared.data.shift(1)
+    if kind == "pct_change":
+        return shared.data.pct_change()
+    source = shared.get((node[1],))
+    # a window of one repeated value has exactly that mean and no deviation,
+    # where pandas' running sums can leave rounding residue
+    if kind == "rolling_mean":
+        mean = pd.rolling_mean(source, node[2])
+        return mean.where(~_one_value(source, node[2]) | mean.isnull(), source)
+    if kind == "rolling_std":
+        std = pd.rolling_std(source, node[2])
+        return std.where(~_one_value(source, node[2]) | std.isnull(), 0)
+    if kind == "ewm":
+        return pd.ewma(source, span=node[2])
+    raise ValueError("Unknown intermediate {}".format(node))
+
+def dependencies(node):
+    """Returns the intermediates @node is computed from."""
+    if node == DATA:
+        return []
+    if node[0] in ("rolling_mean", "rolling_std", "ewm"):
+        return [(node[1],)]
+    return [DATA]
+
+def plan(indicators):
+    """Returns the intermediates read by @indicators, without repeats and
+    each after the ones it is computed from."""
+    order = []
+    def visit(node):
+        if node in order:
+            return
+        for dependency in dependencies(node):
+            visit(dependency)
+        order.append(node)
+    for indicator in indicators:
+        if hasattr(indicator, "requires"):
+            for node in indicator.requires():
+                visit(tuple(node))
+    return order
+
+class Intermediates(object):
+    """Intermediates of one dataset, each computed the first time it is asked
+    for. Given a FrameCache and a @key naming the data (such as the symbol and
+    the date of its source file), they are also kept across calls."""
+
+    def __init__(self, data, cache=None, key=()):
+        self.data = as_frame(data)
+        self.cache = cache
+        self.key = tuple(key)
+        self.values = {DATA: self.data}
+        # the intermediates computed here, in order, rather than found in the cache
+        self.computed = []
+
+    def get(self, node):
+        node = tuple(node)
+        if node not in self.values:
+            value = None
+            if self.cache is not None:
+                value = self.cache.get(self.key + (node,))
+            if value is None:
+                value = _compute(node, self)
+                self.computed.append(node)
+                if self.cache is not None:
+                    value = self.cache.put(self.key + (node,), value)
+            self.values[node] = value
+        return self.values[node]
+
+    def returns(self):
+        return self.get(("returns",))
+
+    def diff(self):
+        return self.get(("diff",))
+
+    def pct_change(self):
+        return self.get(("pct_change",))
+
+    def rolling_mean(self, window, source="data"):
+        return self.get(("rolling_mean", source, window))
+
+    def rolling_std(self, window, source="data"):
+        return self.get(("rolling_std", source, window))
+
+    def ewm(self, span, source="data"):
+        return self.get(("ewm", source, span))
+
+def compute_indicators(data, indicators, shared=None):
+    """Gives @data to each of @indicators and returns their values. Indicators
+    with requires() read their intermediates from @shared (a new Intermediates
+    of @data by default), so the ones they have in common are computed once."""
+    if shared is None:
+        shared = Intermediates(data)
+    for node in plan(indicators):
+        shared.get(node)
+    values = []
+    for indicator in indicators:
+        indicator.addEvidence(data)
+        if hasattr(indicator, "requires"):
+            values.append(indicator.getIndicator(shared))
+        else:
+            values.append(indicator.getIndicator())
+    return values
@@ -0,0 +1,25 @@
+"""
+Symbols x dates NumPy panels as indicator input.
+
+An indicator given a panel computes every symbol at once and returns a panel
+of the same shape. Symbols that were listed later (or delisted earlier) than
+others are padded with NaN, and their indicators are NaN there too.
+"""
+
+import numpy as np
+import pandas as pd
+
+def as_frame(data):
+    """Returns @data as a dates x columns frame, with one column per symbol of
+    a symbols x dates panel."""
+    if isinstance(data, np.ndarray):
+        panel = np.atleast_2d(data)
+        return pd.DataFrame(panel.T, columns=[str(i) for i in range(panel.shape[0])])
+    return data
+
+def like_input(result, data):
+    """Returns @result, computed from as_frame(@data), as a symbols x dates
+    panel if @data was one."""
+    if isinstance(data, np.ndarray):
+        return np.ascontiguousarray(result.values.T)
+    return result
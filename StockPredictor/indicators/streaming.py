@@ -0,0 +1,115 @@
+"""
+Running state for updating indicators one bar at a time.
+
+Every indicator's update(new_bar) builds its state from the data given to
+addEvidence the first time it is called, and then only touches that state.
+"""
+
+import numpy as np
+import pandas as pd
+from panel import as_frame
+
+def bar_values(new_bar, columns):
+    """Returns the values of @new_bar in the order of @columns, and its date.
+    @new_bar may be a one row DataFrame, a Series indexed by column, or an
+    array of values."""
+    if isinstance(new_bar, pd.DataFrame):
+        return new_bar[columns].values[-1].astype(float), new_bar.index[-1]
+    if isinstance(new_bar, pd.Series):
+        return new_bar[columns].values.astype(float), new_bar.name
+    return np.asarray(new_bar, dtype=float).reshape(len(columns)), None
+
+def indicator_row(values, columns, date):
+    """Returns the indicator values of one bar as a one row DataFrame."""
+    return pd.DataFrame([values], columns=columns, index=[date])
+
+def history(indicator, new_bar):
+    """Returns the data given to @indicator.addEvidence, or an empty frame with
+    the columns of @new_bar when there is none."""
+    data = getattr(indicator, "data", None)
+    if data is not None:
+        return as_frame(data)
+    columns = new_bar.columns if isinstance(new_bar, pd.DataFrame) else new_bar.index
+    return pd.DataFrame(columns=columns, dtype=float)
+
+class RingBuffer(object):
+    """The last @size rows of one or more columns."""
+
+    def __init__(self, size, columns, rows=None):
+        self.size = size
+        self.rows = np.full((size, columns), np.nan)
+        self.pos = 0
+        self.filled = 0
+        if rows is not None:
+            for row in rows[-size:]:
+                self.push(row)
+
+    def push(self, values):
+        """Adds a row and returns the row it pushed out, or None while filling."""
+        evicted = self.rows[self.pos].copy() if self.filled == self.size else None
+        self.rows[self.pos] = values
+        self.pos = (self.pos + 1) % self.size
+        self.filled = min(self.filled + 1, self.size)
+        return evicted
+
+    def get(self, lag):
+        """Returns the row pushed @lag pushes ago (0 is the latest), or NaNs."""
+        if lag >= self.filled:
+            return np.full(self.rows.shape[1], np.nan)
+        return self.rows[(self.pos - 1 - lag) % self.size]
+
+    def values(self):
+        """Returns the rows held, oldest first."""
+        if self.filled < self.size:
+            return self.rows[:self.filled]
+        return np.roll(self.rows, -self.pos, axis=0)
+
+class RollingSums(object):
+    """Running sum and sum of squares of the last @window rows. Like
+    pd.rolling_mean and pd.rolling_std, the statistics are NaN until @window
+    rows have been seen and while a NaN or inf is in the window. The sums are taken
+    around a reference value and rebuilt from the window every @window rows,
+    so rounding errors do not pile up."""
+
+    def __init__(self, window, columns, rows=None):
+        self.window = window
+        self.buffer = RingBuffer(window, columns, rows)
+        self._resync()
+
+    def _resync(self):
+        rows = self.buffer.values()
+        nans = ~np.isfinite(rows)
+        self.nans = nans.sum(axis=0)
+        self.ref = np.zeros(rows.shape[1])
+        if rows.shape[0]:
+            with np.errstate(invalid="ignore"):
+                self.ref = np.where(nans.all(axis=0), 0, np.nanmean(np.where(nans, 0, rows), axis=0))
+        centered = np.where(nans, 0, rows - self.ref)
+        self.sum = centered.sum(axis=0)
+        self.sq_sum = (centered**2).sum(axis=0)
+        self.pushes = 0
+
+    def push(self, values):
+        evicted = self.buffer.push(values)
+        for row, sign in [(values, 1), (evicted, -1)]:
+            if row is None:
+                continue
+            nan = ~np.isfinite(row)
+            centered = np.where(nan, 0, row - self.ref)
+            self.sum += sign*centered
+            self.sq_sum += sign*centered**2
+            self.nans += sign*nan
+        self.pushes += 1
+        if self.pushes >= self.window:
+            self._resync()
+
+    def _valid(self, stat):
+        return np.where((self.buffer.filled < self.window) | (self.nans > 0), np.nan, stat)
+
+    def mean(self):
+        return self._valid(self.ref + self.sum/self.window)
+
+    def std(self):
+        """Sample standard deviation (ddof=1), as pd.rolling_std."""
+        var = (self.sq_sum - self.sum**2/self.window)/(self.window - 1)
+        return self._valid(np.sqrt(np.maximum(var, 0)))
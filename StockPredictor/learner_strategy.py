@@ -16,6 +16,7 @@ from indicators.Bollinger import Bollinger
 from indicators.SimpleMA import SimpleMA as SMA
 # Import dataset retrieval
 from dataset_construction import create_input, create_output
+from marketsim import ORDER_DTYPE
 # Import error metrics
 from error_metrics import rmse, mape
 # Import normalization
@@ -106,70 +107,55 @@ def issue_stock_order(df, date, sym, order, shares):
 					ignore_index=True)
 	return df
 
-def learner_strategy(data, threshold=0.05, sym="IBM", horizon=5, num_shares=100, shorting=False):
-	df = pd.DataFrame()
-	df = df.append({'Date': np.nan, 'Symbol': np.nan, 'Order': np.nan, 'Shares': np.nan}, ignore_index=True)
-	cols = [col for col in data.columns if col.startswith("Pred")]
-	position = None
-	days = 0
-#	print "Date,Symbol,Order,Shares"
-	t=0
-	df = issue_stock_order(df, data.index[t].strftime("%Y-%m-%d"), sym, "BUY", 0)
-	for i in data.index:
-		multiplier=1
-		pred = data.ix[i,:].values
-		if np.abs(pred)>5*threshold: multiplier=2
-		if pred>threshold:
-			try:
-				df = issue_stock_order(df, data.index[t+horizon].strftime("%Y-%m-%d"), sym, "SELL", int(multiplier*num_shares))
-				df = issue_stock_order(df, data.index[t].strftime("%Y-%m-%d"), sym, "BUY", int(multiplier*num_shares))
-			except IndexError:
-				continue
-		elif pred<-threshold and shorting:
-			try:
-				df = issue_stock_order(df, data.index[t+horizon].strftime("%Y-%m-%d"), sym, "BUY", int(multiplier*num_shares))
-				df = issue_stock_order(df, data.index[t].strftime("%Y-%m-%d"), sym, "SELL", int(multiplier*num_shares))
-			except IndexError:
-				continue
-		t+=1
-				
-##		if position==None:
-##			if data.ix[i,:].values[0]>threshold:
-##				if data.ix[i,:].values[0]>2*threshold: multiplier = 2
-##				else: multiplier=1
-##				position="LONG"
-##				df = issue_stock_order(df, i.strftime("%Y-%m-%d"), sym, "BUY", int(multiplier*num_shares))
-###					print "{0},{1},BUY,{2}".format(i.strftime("%Y-%m-%d"),sym,multiplier*num_shares)
-##				days += 1
-##			if data.ix[i,:].values[0]<-threshold and shorting:
-##				if data.ix[i,:].values[0]>2*threshold: multiplier = 2
-##				else: multiplier=1
-##				position="SHORT"
-##				df = issue_stock_order(df, i.strftime("%Y-%m-%d"), sym, "SELL", int(multiplier*num_shares))
-###					print "{0},{1},SELL,{2}".format(i.strftime("%Y-%m-%d"),sym,multiplier*num_shares)
-##				days += 1
-##		else:
-##			if position:
-##				days += 1
-##			if (data.ix[i,:].values[0]>threshold and position=="SHORT" or days>=horizon) and shorting:
-##				last_shares = int(df.Shares.iloc[-1])
-##				df = issue_stock_order(df, i.strftime("%Y-%m-%d"), sym, "BUY", last_shares)
-###					print "{0},{1},BUY,{2}".format(i.strftime("%Y-%m-%d"), sym, last_shares)
-##				position, days = None, 0
-##			if (data.ix[i,:].values[0]<-threshold and position=="LONG") or days>=horizon:
-##				last_shares = int(df.Shares.iloc[-1])
-##				df = issue_stock_order(df, i.strftime("%Y-%m-%d"), sym, "SELL", last_shares)
-###					print "{0},{1},SELL,{2}".format(i.strftime("%Y-%m-%d"), sym, last_shares)
-##				position, days = None, 0
-				
-	df = df.dropna()
-	df = df.sort_values(by=["Date"],ascending=True)
-	df.index = df.Date
-	df = df[[col for col in df.columns if col!="Date"]]
+def learner_strategy(data, threshold=0.05, sym="IBM", horizon=5, num_shares=100, shorting=False, store=True,
+					 as_array=False):
+	"""Returns the orders frame for trading on predicted returns in @data and,
+	if @store, writes it to orders/learner_orders.csv.
+	A prediction above @threshold buys on its date and sells @horizon rows
+	later (shorting does the reverse below -@threshold), with twice the
+	shares beyond 5*@threshold. Predictions whose exit falls past the end
+	of @data are not traded.
+	With @as_array the orders are returned as an ORDER_DTYPE array instead,
+	which simulate_orders takes without building a frame."""
+	pred = data.values[:,0]
+	n = pred.shape[0]
+	dates = data.index.strftime("%Y-%m-%d")
+	with np.errstate(invalid="ignore"):
+		multiplier = np.where(np.abs(pred)>5*threshold, 2, 1)
+		longs = pred>threshold
+		shorts = (pred<-threshold) & shorting & ~longs
+	shares = (multiplier*num_shares).astype(int)
+	# a trade's exit must fall inside the data
+	t = np.flatnonzero((longs | shorts) & (np.arange(n)+horizon < n))
+	long_trade = longs[t]
+
+	# an initial empty BUY, then each trade's exit followed by its entry
+	day = np.empty(1+2*t.shape[0], dtype=int)
+	order = np.empty(day.shape[0], dtype=object)
+	order_shares = np.empty(day.shape[0])
+	day[0], order[0], order_shares[0] = 0, "BUY", 0
+	day[1::2], day[2::2] = t+horizon, t
+	order[1::2] = np.where(long_trade, "SELL", "BUY")
+	order[2::2] = np.where(long_trade, "BUY", "SELL")
+	order_shares[1::2] = order_shares[2::2] = shares[t]
+
+	# the same (unstable) sort of the date strings as sort_values, so orders
+	# on one date keep the order they have always been simulated in
+	order_dates = dates[day]
+	sort = np.argsort(order_dates, kind="quicksort")
+	if as_array:
+		orders = np.zeros(sort.shape[0], dtype=ORDER_DTYPE)
+		orders["Date"] = data.index.values[day[sort]]
+		orders["Order"] = order[sort]
+		orders["Shares"] = order_shares[sort]
+		return orders
+	df = pd.DataFrame({"Symbol": sym, "Order": order[sort], "Shares": order_shares[sort]},
+					  index=pd.Index(order_dates[sort], name="Date"))
 	colms = ['Symbol', 'Order', 'Shares']
 	df =  df[colms]
-	df.to_csv("orders/learner_orders.csv", index_label="Date")
-
+	if store:
+		df.to_csv("orders/learner_orders.csv", index_label="Date")
+	return df
 
 if __name__=="__main__":
 	try:
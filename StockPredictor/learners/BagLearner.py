@@ -2,20 +2,103 @@
 A simple wrapper for k-nearest neighbors regression.
 """
 
+import hashlib
+import inspect
 import numpy as np
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 from KNNLearner import KNNLearner
 
+def _fit_sample(learner, dataX, dataY, idx):
+    """Train @learner on rows @idx of the data, without copying them when the
+    learner can fit on row indices or row weights."""
+    fit_args = inspect.getargspec(learner.addEvidence).args
+    if "idx" in fit_args:
+        learner.addEvidence(dataX, dataY, idx=idx)
+    elif "sample_weight" in fit_args:
+        learner.addEvidence(dataX, dataY, sample_weight=np.bincount(idx, minlength=dataX.shape[0]))
+    else:
+        learner.addEvidence(dataX[idx,:], dataY[idx])
+
+def _fit_bag(args):
+    """Train @learner on a bootstrap sample drawn with its own random stream."""
+    learner, dataX, dataY, seed = args
+    n = dataX.shape[0]
+    idx = np.random.RandomState(seed).choice(n, size=n, replace=True).astype(np.int32)
+    _fit_sample(learner, dataX, dataY, idx)
+    return learner
+
+def _weighted_sample(weights, n, rng):
+    """Draw @n row indices with probability proportional to @weights, by
+    searching a cumulative distribution for uniform draws."""
+    cdf = np.cumsum(weights)
+    if not cdf[-1] > 0:
+        return rng.randint(0, n, size=n).astype(np.int32)
+    idx = np.searchsorted(cdf, rng.random_sample(n)*cdf[-1], side="right")
+    return np.minimum(idx, len(cdf)-1).astype(np.int32)
+
+def _data_key(data):
+    """Key of an array by its contents, which unlike its identity changes when
+    the array is edited in place."""
+    data = np.ascontiguousarray(data)
+    return data.shape, data.dtype.str, hashlib.sha1(data).hexdigest()
+
+def _in_sample(learner, dataX, ranked):
+    """Predict @learner's training rows @dataX. With @ranked, the distances and
+    indices of the rows nearest each row sorted nearest first, a nearest
+    neighbor learner estimates from those instead of searching dataX again.
+    Only rows without k sampled rows among their ranked ones are queried."""
+    if ranked is None:
+        return learner.query(dataX)
+    preds = learner.estimate(*ranked)
+    missing = np.flatnonzero(np.isnan(preds))
+    if missing.size:
+        preds[missing] = learner.query(dataX[missing])
+    return preds
+
+def _query_bag(args):
+    learner, points = args
+    return learner.query(points)
+
 class BagLearner(object):
-    
-    def __init__(self, learner=KNNLearner, kwargs = {"k":3}, bags = 20, boost = False, verbose = False):
+
+    # rows ranked around each training row when boosting nearest neighbor learners
+    ranked_neighbors = 64
+
+    def __init__(self, learner=KNNLearner, kwargs = {"k":3}, bags = 20, boost = False,
+                 n_jobs = 1, executor = "thread", seed = None, verbose = False):
+        """
+        @param n_jobs: number of bags trained and queried at once.
+        @param executor: "thread" for learners that release the GIL (such as
+        sklearn models), "process" for pure python learners.
+        @param seed: seed for the bootstrap samples. Each bag draws from its own
+        random stream, so results do not depend on n_jobs or executor.
+        Learners that can fit on row indices (KNNLearner) or row weights
+        (LinRegLearner) share dataX instead of storing a resampled copy. Bags
+        trained by the process executor come back with their own copy.
+        """
         self.learners = [learner(**kwargs) for i in range(0, bags)]
         self.boost = boost
+        self.n_jobs = n_jobs
+        self.executor = executor
+        self.seed = seed
         self.verbose = verbose
+        self.train_key = None
         try:
         	self.name = "{} Bag Learner: {}".format(bags, self.learners[0].name)
         except AttributeError:
         	self.name = "{} Bag Learner".format(bags)
-        	
+
+    def _map(self, func, tasks):
+        if self.n_jobs == 1:
+            return [func(task) for task in tasks]
+        pool = ThreadPool(self.n_jobs) if self.executor == "thread" else Pool(self.n_jobs)
+        try:
+            return pool.map(func, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
     def addEvidence(self, dataX, dataY):
         """
         @summary: Add training data to learner
@@ -23,25 +106,54 @@ class BagLearner(object):
         @param dataY: the Y training values
         """
         n = dataX.shape[0]
-        # build and save the model
-        idx = np.random.choice(n, size=n, replace=True)
-
-        for learner in self.learners:
-            learner.addEvidence(dataX[idx,:], dataY[idx])
-            if self.boost:
-                errors = np.abs(learner.query(dataX)-dataY)
-                weights = errors/sum(errors)
-                idx = np.random.choice(n, size=n, replace=True, p=weights)
-            else:
-                idx = np.random.choice(n, size=n, replace=True)
-        
+        # one seed per bag, drawn from the global stream unless a seed is given
+        rng = np.random.RandomState(self.seed) if self.seed is not None else np.random
+        seeds = rng.randint(0, 2**31-1, size=len(self.learners))
+
+        if not self.boost:
+            tasks = [(learner, dataX, dataY, seed) for learner, seed in zip(self.learners, seeds)]
+            self.learners = self._map(_fit_bag, tasks)
+            return
+
+        # each boosted bag is drawn from the errors of the one before it on dataX.
+        # Bags are fit on resamples of the same rows, so nearest neighbor learners
+        # rank the rows around each row once and read their errors off that.
+        learner = self.learners[0]
+        ranked = None
+        if hasattr(learner, "estimate") and "idx" in inspect.getargspec(learner.addEvidence).args:
+            learner.addEvidence(dataX, dataY)
+            dist, nearest = learner.neighbors(dataX, min(n, self.ranked_neighbors))
+            order = np.argsort(dist, axis=1)
+            rows = np.arange(n)[:, None]
+            ranked = (dist[rows, order], nearest[rows, order])
+        # the predictions behind the errors are kept, so querying the same
+        # training data afterwards costs nothing extra
+        self.train_key = _data_key(dataX)
+        self.train_preds = [None]*len(self.learners)
+        idx = np.random.RandomState(seeds[0]).choice(n, size=n, replace=True).astype(np.int32)
+        for i, (learner, seed) in enumerate(zip(self.learners, seeds[1:].tolist()+[None])):
+            _fit_sample(learner, dataX, dataY, idx)
+            if seed is None:
+                break
+            self.train_preds[i] = _in_sample(learner, dataX, ranked)
+            errors = np.abs(self.train_preds[i]-dataY)
+            idx = _weighted_sample(errors, n, np.random.RandomState(seed))
+
     def query(self,points):
         """
         @summary: Estimate a set of test points given the model we built.
         @param points: should be a numpy array with each row corresponding to a specific query.
         @returns the estimated values according to the saved model.
         """
-        
-        estimates = [learner.query(points) for learner in self.learners]
+
+        if self.train_key is not None and np.shape(points) == self.train_key[0] \
+           and _data_key(points) == self.train_key:
+            # in sample predictions were cached while boosting
+            for i, learner in enumerate(self.learners):
+                if self.train_preds[i] is None:
+                    self.train_preds[i] = learner.query(points)
+            return np.mean(self.train_preds, axis=0)
+
+        estimates = self._map(_query_bag, [(learner, points) for learner in self.learners])
         return np.mean(estimates, axis=0)
 
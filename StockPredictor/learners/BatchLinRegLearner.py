@@ -0,0 +1,77 @@
+"""
+Linear regression for many symbols that share a feature layout, fitted in one solve.
+"""
+
+import numpy as np
+from IncLinRegLearner import solve_normal_equations
+
+def stack_padded(arrays):
+    """
+    @summary: Stack 2-D (rows, features) or 1-D arrays of unequal length into one
+    array padded with zeros at the end.
+    @returns the stacked array and a (arrays, rows) mask of the real rows.
+    """
+    arrays = [np.asarray(a, dtype=float) for a in arrays]
+    rows = max(a.shape[0] for a in arrays)
+    stacked = np.zeros((len(arrays), rows) + arrays[0].shape[1:])
+    mask = np.zeros((len(arrays), rows), dtype=bool)
+    for i, a in enumerate(arrays):
+        stacked[i, :a.shape[0]] = a
+        mask[i, :a.shape[0]] = True
+    return stacked, mask
+
+class BatchLinRegLearner(object):
+
+    def __init__(self, verbose = False):
+        """
+        Fits one linear regression per symbol. The (symbols, rows, features)
+        design matrices are reduced to stacked normal equations and solved by a
+        single batched pseudo-inverse.
+        """
+        self.name = "Batched Linear Regression Learner"
+        self.verbose = verbose
+
+    def addEvidence(self, dataX, dataY, mask=None):
+        """
+        @summary: Add training data to learner
+        @param dataX: (symbols, rows, features) X values, or a list of 2-D
+        arrays with different numbers of rows
+        @param dataY: (symbols, rows) Y training values, or a list of 1-D arrays
+        @param mask: optional (symbols, rows) boolean array of the rows to fit on.
+        Rows with NaNs are always left out.
+        """
+        if isinstance(dataX, (list, tuple)):
+            dataX, mask = stack_padded(dataX)
+            dataY, _ = stack_padded(dataY)
+        dataX = np.asarray(dataX, dtype=float)
+        dataY = np.asarray(dataY, dtype=float)
+        valid = ~(np.isnan(dataX).any(axis=2) | np.isnan(dataY))
+        if mask is not None:
+            valid &= mask
+
+        # slap on 1s column so linear regression finds a constant term
+        newdataX = np.ones(dataX.shape[:2] + (dataX.shape[2]+1,))
+        newdataX[:,:,:-1] = dataX
+        newdataX[~valid] = 0
+        newdataY = np.where(valid, dataY, 0)
+
+        XtX = np.matmul(newdataX.transpose(0, 2, 1), newdataX)
+        Xty = np.matmul(newdataX.transpose(0, 2, 1), newdataY[:,:,None])[:,:,0]
+        # build and save the model, one row of coefficients per symbol with the constant last
+        self.model_coefs = solve_normal_equations(XtX, Xty)
+        return self.model_coefs
+
+    def query(self,points):
+        """
+        @summary: Estimate a set of test points given the model we built.
+        @param points: (symbols, rows, features) array, or (symbols, features)
+        for one point per symbol.
+        @returns the estimated values, one row per symbol.
+        """
+        points = np.asarray(points, dtype=float)
+        if points.ndim == 2:
+            return self.query(points[:,None,:])[:,0]
+        return np.matmul(points, self.model_coefs[:,:-1,None])[:,:,0] + self.model_coefs[:,-1:]
+
+if __name__=="__main__":
+    print "the secret clue is 'zzyzx'"
@@ -0,0 +1,118 @@
+"""
+Linear regression kept as sufficient statistics, so rows can be added and removed.
+"""
+
+import numpy as np
+
+def _design(dataX):
+    # slap on 1s column so linear regression finds a constant term
+    dataX = np.asarray(dataX, dtype=float)
+    newdataX = np.ones([dataX.shape[0],dataX.shape[1]+1])
+    newdataX[:,0:dataX.shape[1]] = dataX
+    return newdataX
+
+def solve_normal_equations(XtX, Xty):
+    """
+    @summary: Solve the normal equations XtX b = Xty.
+    @param XtX: (d, d) matrix, or a (s, d, d) stack of them for s problems
+    that share a feature layout.
+    @param Xty: (d,) vector, or a (s, d) stack of them.
+    @returns the coefficients, shaped like Xty.
+    """
+    # The pseudo-inverse drops directions the data does not pin down, such as
+    # collinear features, and gives the minimum norm solution there instead of
+    # huge coefficients that cancel out. XtX is symmetric, so its eigenvalues
+    # give the pseudo-inverse at half the cost of np.linalg.pinv.
+    eigvals, eigvecs = np.linalg.eigh(XtX)
+    keep = np.abs(eigvals) > 1e-15*np.abs(eigvals).max(axis=-1)[...,None]
+    inv_eigvals = np.where(keep, 1/np.where(keep, eigvals, 1), 0)
+    proj = np.matmul(np.swapaxes(eigvecs, -1, -2), Xty[...,None])
+    return np.matmul(eigvecs, inv_eigvals[...,None]*proj)[...,0]
+
+def solve_batch(learners):
+    """
+    @summary: Solve the models of many IncLinRegLearners with the same number
+    of features in one batched call, instead of one solve per learner.
+    """
+    coefs = solve_normal_equations(np.array([learner.XtX for learner in learners]),
+                                   np.array([learner.Xty for learner in learners]))
+    for learner, c in zip(learners, coefs):
+        learner.model_coefs = c
+    return coefs
+
+class IncLinRegLearner(object):
+
+    def __init__(self, verbose = False):
+        """
+        The model is kept as X'X and X'y, with a constant column appended to X.
+        partial_fit and remove update them in O(d^2) per row, so a rolling
+        window slides without refitting. The coefficients are solved lazily
+        on the next query.
+        """
+        self.name = "Incremental Linear Regression Learner"
+        self.verbose = verbose
+        self.XtX = None
+        self.Xty = None
+        self.n_samples = 0
+        self.model_coefs = None
+
+    def addEvidence(self, dataX, dataY, sample_weight=None):
+        """
+        @summary: Add training data to learner, replacing any earlier data
+        @param dataX: X values of data to add
+        @param dataY: the Y training values
+        @param sample_weight: optional weight of each row
+        """
+        self.XtX = None
+        self.Xty = None
+        self.n_samples = 0
+        self.partial_fit(dataX, dataY, sample_weight)
+
+    def partial_fit(self, dataX, dataY, sample_weight=None):
+        """
+        @summary: Add rows to the data the model is fitted on
+        @param dataX: X values of data to add
+        @param dataY: the Y training values
+        @param sample_weight: optional weight of each row
+        """
+        newdataX = _design(dataX)
+        dataY = np.asarray(dataY, dtype=float)
+        if self.XtX is None:
+            self.XtX = np.zeros((newdataX.shape[1], newdataX.shape[1]))
+            self.Xty = np.zeros(newdataX.shape[1])
+        weightedX = newdataX if sample_weight is None else newdataX*np.asarray(sample_weight)[:,None]
+        self.XtX += np.dot(weightedX.T, newdataX)
+        self.Xty += np.dot(weightedX.T, dataY)
+        self.n_samples += newdataX.shape[0] if sample_weight is None else np.sum(sample_weight)
+        self.model_coefs = None
+
+    def remove(self, dataX, dataY, sample_weight=None):
+        """
+        @summary: Remove rows previously added with addEvidence or partial_fit
+        @param dataX: X values of data to remove
+        @param dataY: the Y training values
+        @param sample_weight: the weights the rows were added with
+        """
+        sample_weight = -np.ones(len(dataY), dtype=int) if sample_weight is None else -np.asarray(sample_weight)
+        self.partial_fit(dataX, dataY, sample_weight)
+
+    def solve(self):
+        """
+        @summary: Solve the model from the sufficient statistics
+        @returns the coefficients, with the constant term last
+        """
+        if self.model_coefs is None:
+            self.model_coefs = solve_normal_equations(self.XtX, self.Xty)
+        return self.model_coefs
+
+    def query(self,points):
+        """
+        @summary: Estimate a set of test points given the model we built.
+        @param points: should be a numpy array with each row corresponding to a specific query.
+        @returns the estimated values according to the saved model.
+        """
+        coefs = self.solve()
+        return np.dot(points, coefs[:-1]) + coefs[-1]
+
+if __name__=="__main__":
+    print "the secret clue is 'zzyzx'"
@@ -3,40 +3,157 @@ A simple wrapper for k-nearest neighbors regression.
 """
 
 import numpy as np
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
 
 class KNNLearner(object):
 
-    def __init__(self, k=3, verbose = False):
+    # KD-trees stop paying off once the data has more dimensions than this
+    max_tree_dims = 10
+
+    def __init__(self, k=3, method="auto", leafsize=16, block_size=256, weights="uniform", verbose = False):
+        """
+        @param method: "kdtree" to search a spatial index built in addEvidence,
+        "brute" to compute distances to every training row, or "auto" to use a
+        KD-tree for low dimensional data when scipy is available.
+        @param block_size: number of query rows whose distances to the training
+        rows are held in memory at once by the brute force search.
+        @param weights: "uniform" to average the neighbors' values, or "distance"
+        to weight each neighbor by the inverse of its distance.
+        """
         self.k = k
+        self.method = method
+        self.leafsize = leafsize
+        self.block_size = block_size
+        self.weights = weights
         self.verbose = verbose
         self.name = "{}-Nearest Neighbors Learner".format(k)
-    
-    def addEvidence(self, dataX, dataY):
+
+    def addEvidence(self, dataX, dataY, idx=None):
         """
         @summary: Add training data to learner
         @param dataX: X values of data to add
         @param dataY: the Y training values
+        @param idx: optional row indices (with repeats) of a bootstrap sample.
+        The learner then keeps a reference to dataX and a count of each row
+        instead of a copy of the sampled rows.
         """
 
-        # slap on 1s column so linear regression finds a constant term
-
         # build and save the model
-        self.Xtrain = dataX
-        self.Ytrain = dataY
-        
+        self.Xtrain = np.asarray(dataX, dtype=float)
+        # a column of Y values is kept flat so queries return one value per point
+        self.Ytrain = np.asarray(dataY).ravel()
+        self.counts = None
+        rows = np.arange(self.Xtrain.shape[0])
+        if idx is not None:
+            self.counts = np.bincount(idx, minlength=self.Xtrain.shape[0]).astype(np.int32)
+            rows = np.flatnonzero(self.counts)
+        self.tree = None
+        if self.method == "kdtree" or (self.method == "auto" and cKDTree is not None
+                                       and self.Xtrain.shape[1] <= self.max_tree_dims):
+            # the tree loses rows with infinite values, which brute force keeps
+            if np.isfinite(self.Xtrain).all():
+                self.tree = cKDTree(self.Xtrain[rows], leafsize=self.leafsize)
+                self.tree_rows = rows
+        self.sq_norms = np.einsum("ij,ij->i", self.Xtrain, self.Xtrain)
+        if self.counts is not None:
+            self.sq_norms[self.counts == 0] = np.inf
+
+    def neighbors(self, points, k):
+        """
+        @summary: Find the k nearest distinct training rows of each point.
+        @returns arrays of distances and training row indices, one row per point.
+        """
+        if self.tree is not None and np.isfinite(points).all():
+            dist, nearest = self.tree.query(points, k=k)
+            nearest = self.tree_rows[nearest]
+            return dist.reshape(points.shape[0], k), nearest.reshape(points.shape[0], k)
+
+        dist = np.empty((points.shape[0], k))
+        nearest = np.empty((points.shape[0], k), dtype=int)
+        for start in range(0, points.shape[0], self.block_size):
+            block = points[start:start+self.block_size]
+            # infinite values leave NaN distances, handled below
+            with np.errstate(invalid="ignore"):
+                # ||a-b||^2 = ||a||^2 + ||b||^2 - 2ab for the whole block at once
+                sq_dist = np.dot(block, self.Xtrain.T)
+                sq_dist *= -2
+                sq_dist += self.sq_norms
+                sq_dist += np.einsum("ij,ij->i", block, block)[:, None]
+                np.maximum(sq_dist, 0, out=sq_dist)
+                # Only the k smallest distances need to be found, not sorted
+                block_nearest = np.argpartition(sq_dist, k-1, axis=1)[:, :k]
+                # The expansion cancels badly for close points, so the distances to
+                # the k found are computed directly, exactly 0 for training rows
+                diff = block[:, None, :] - self.Xtrain[block_nearest]
+                block_dist = np.sqrt(np.einsum("ijk,ijk->ij", diff, diff))
+            # Points without k finite distances (NaN or inf in the point or the
+            # training rows) take the neighbors a full sort of their distances gives
+            for i in np.flatnonzero(~np.isfinite(block_dist).all(axis=1)):
+                block_dist[i], block_nearest[i] = self._sorted_neighbors(block[i], k)
+            dist[start:start+block.shape[0]] = block_dist
+            nearest[start:start+block.shape[0]] = block_nearest
+        return dist, nearest
+
+    def _sorted_neighbors(self, point, k):
+        rows = np.arange(self.Xtrain.shape[0]) if self.counts is None else np.flatnonzero(self.counts)
+        with np.errstate(invalid="ignore"):
+            diff = point - self.Xtrain[rows]
+            dist = np.sum(diff**2, axis=1)**0.5
+        nearest = np.argsort(dist)[:k]
+        return dist[nearest], rows[nearest]
+
     def query(self,points):
         """
         @summary: Estimate a set of test points given the model we built.
         @param points: should be a numpy array with each row corresponding to a specific query.
         @returns the estimated values according to the saved model.
         """
-        
-        estimates = np.zeros(points.shape[0])
-        for i, point in enumerate(points):
-            diff = (point - self.Xtrain)
-            dist = np.sum(diff**2, axis=1)**0.5
-            nearest_neighbors = np.argsort(dist)[0:self.k]
-            estimates[i] = np.mean(self.Ytrain[nearest_neighbors])
+        points = np.asarray(points, dtype=float)
+        if self.counts is None:
+            k = min(self.k, self.Xtrain.shape[0])
+            return self.estimate(*self.neighbors(points, k))
+        k = min(self.k, self.counts.sum())
+        dist, nearest = self.neighbors(points, min(k, np.count_nonzero(self.counts)))
+        order = np.argsort(dist, axis=1)
+        rows = np.arange(points.shape[0])[:, None]
+        return self.estimate(dist[rows, order], nearest[rows, order])
+
+    def estimate(self, dist, nearest):
+        """
+        @summary: Estimate points from candidate neighbors found beforehand.
+        @param dist: distances to the candidates, one row per point
+        @param nearest: training row indices of the candidates. For a model fit
+        on a bootstrap sample they must be sorted nearest first, and rows left
+        out of the sample count for nothing.
+        @returns the estimated values, NaN for points whose candidates hold fewer
+        than k sampled rows.
+        """
+        if self.counts is None:
+            # every neighbor counts once
+            k = nearest.shape[1]
+            taken = np.ones(nearest.shape)
+        else:
+            # Rows drawn several times fill several of the k places, nearest first
+            k = min(self.k, self.counts.sum())
+            counts = self.counts[nearest]
+            taken = np.clip(k - (np.cumsum(counts, axis=1) - counts), 0, counts)
+        values = self.Ytrain[nearest]
+        if self.weights == "uniform":
+            if self.counts is None:
+                return np.mean(values, axis=1)
+            estimates = np.sum(taken*values, axis=1) / k
+        else:
+            # Points that coincide with training rows take the mean of those rows
+            exact = (dist == 0) & (taken > 0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                weights = np.where(taken > 0, taken/dist, 0)
+                weights = np.where(exact.any(axis=1)[:, None], taken*exact, weights)
+                estimates = np.sum(weights*values, axis=1) / np.sum(weights, axis=1)
+        if self.counts is not None:
+            estimates[np.sum(taken, axis=1) < k] = np.nan
         return estimates
 
 if __name__=="__main__":
@@ -15,23 +15,31 @@ class LinRegLearner(object):
 		self.name = "Linear Regression Learner"
         # pass # move along, these aren't the drones you're looking for
 
-    def addEvidence(self,dataX,dataY):
+    def addEvidence(self,dataX,dataY,sample_weight=None):
         """
         @summary: Add training data to learner
         @param dataX: X values of data to add
         @param dataY: the Y training values
+        @param sample_weight: optional weight of each row, such as the number
+        of times a bootstrap sample drew it
         """
         
         try:
         	self.model = LinearRegression()
-        	self.model.fit(dataX, dataY)
+        	self.model.fit(dataX, dataY, sample_weight=sample_weight)
         except:
 			# slap on 1s column so linear regression finds a constant term
 			newdataX = np.ones([dataX.shape[0],dataX.shape[1]+1])
 			newdataX[:,0:dataX.shape[1]]=dataX
+			newdataY = dataY
+			if sample_weight is not None:
+				# scaling rows by the root of their weight gives weighted least squares
+				root_weight = np.sqrt(sample_weight)
+				newdataX *= root_weight[:,None]
+				newdataY = dataY*root_weight
 
 			# build and save the model
-			self.model_coefs, residuals, rank, s = np.linalg.lstsq(newdataX, dataY)
+			self.model_coefs, residuals, rank, s = np.linalg.lstsq(newdataX, newdataY)
         
     def query(self,points):
         """
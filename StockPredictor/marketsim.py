@@ -8,8 +8,12 @@ import os, sys
 from helpers.util import get_data, plot_data
 from dataset_construction import create_input
 
+# Layout of in-memory orders, matching the columns of an orders csv file.
+ORDER_DTYPE = np.dtype([("Date", "M8[ns]"), ("Order", "S4"), ("Shares", "f8")])
+
 def compute_portvals(orders_file = "./orders/orders.csv", start_val = 1000000, allowed_leverage=2.0, testing=False):
-	"""Returns a dataframe with the portfolio values over the time specified by the orders file."""
+	"""Returns a dataframe with the portfolio values over the time specified by the orders file.
+	Orders may trade any number of symbols; leverage is checked across all positions."""
 	print "Starting Cash Value = ${}".format( start_val )
 	# 1 Read CSV into trades array
 	trades = pd.read_csv(orders_file, index_col="Date", 
@@ -21,48 +25,104 @@ def compute_portvals(orders_file = "./orders/orders.csv", start_val = 1000000, a
 	# 3 Scan trades for dates
 	start_date = pd.to_datetime(trades.index.min())
 	
-	# 4 Read in data
-	adj_close = create_input(symbols[0], indicators=[], store=False).ix[start_date:,:]
-	adj_close = pd.DataFrame(adj_close[[col for col in adj_close.columns if col.startswith("Adj")]])
-	adj_close.columns = [symbols[0]]
-	portvals= adj_close
-	portvals = portvals[symbols]  # remove SPY
+	# 4 Read in data for every symbol traded
+	portvals = get_prices(symbols, start_date=start_date)
 	
-	# 5 Scan trades to update cash
-	on_hand = portvals.copy()
-	on_hand[:] = 0.0
-	# 6 Scan trades to create ownership array
-	portfolio = portvals.copy()
-	portfolio[:] = 0.
-
-	# 5 + 6
+	# 5 + 6 + 7 Replay orders and value the fund
+	portvals, cash = simulate_portfolio(trades, portvals, start_val,
+										allowed_leverage=allowed_leverage, testing=testing)
+	print "Ending Cash Value = ${}".format( cash.iloc[-1] )
+	return portvals
+
+def simulate_portfolio(trades, prices, start_val, allowed_leverage=2.0, testing=False, verbose=True):
+	"""Returns the daily fund value and cash for the @trades orders frame
+	priced by @prices, a frame with one column per symbol traded."""
+	portvals = prices
+	# 5 + 6 Replay orders to find the ones that stay within the leverage limit
+	day_idx, sym_idx, shares = orders_to_arrays(trades, portvals)
+	prices = portvals.values
+	accepted = replay_orders(day_idx, sym_idx, shares, prices, start_val,
+							 allowed_leverage=allowed_leverage, testing=testing, verbose=verbose)
+
+	# 5 Scatter accepted orders into daily cash changes
+	day_idx, sym_idx, shares = day_idx[accepted], sym_idx[accepted], shares[accepted]
+	on_hand = np.zeros(prices.shape)
+	np.add.at(on_hand, (day_idx, sym_idx), -shares*prices[day_idx, sym_idx])
+	on_hand = pd.DataFrame(on_hand, index=portvals.index, columns=portvals.columns)
+	# 6 Scatter accepted orders into daily changes in ownership
+	portfolio = np.zeros(prices.shape)
+	np.add.at(portfolio, (day_idx, sym_idx), shares)
+
+	cash = np.sum(on_hand, axis=1)
+	cash_values = cash.values.copy()
+	cash_values[0] += start_val
+	cash[:] = np.cumsum(cash_values)
+
+	portfolio = pd.DataFrame(np.cumsum(portfolio, axis=0),
+							 index=portvals.index, columns=portvals.columns)
+	portfolio = portfolio*portvals
+	portfolio = np.sum(portfolio, axis=1)
+	
+	# 7 Scan cash and value to create total fund value
+	portvals = pd.DataFrame(portfolio + cash)
+	portvals.columns = ["Portfolio"]
+	return portvals, cash
+
+def get_prices(symbols, start_date=None, end_date=None, fill=True):
+	"""Returns adjusted closing prices with one column per symbol, aligned on
+	the union of their trading dates. If @fill, a symbol's last price is
+	carried forward over dates it did not trade."""
+	frames = []
+	for sym in symbols:
+		adj_close = create_input(sym, indicators=[], store=False)
+		adj_close = pd.DataFrame(adj_close[[col for col in adj_close.columns if col.startswith("Adj")]])
+		adj_close.columns = [sym]
+		frames.append(adj_close)
+	prices = pd.concat(frames, axis=1)
+	if fill:
+		prices = prices.ffill()
+	return prices.ix[start_date:end_date,:]
+
+def orders_to_arrays(trades, prices):
+	"""Convert an orders frame into row positions in @prices for each order's
+	date and symbol, and share counts that are negative for sells."""
+	dates = pd.to_datetime(trades.index)
+	day_idx = prices.index.get_indexer(dates)
+	sym_idx = prices.columns.get_indexer(trades.Symbol.values)
+	if (day_idx < 0).any():
+		raise KeyError(dates[day_idx < 0][0])
+	if (sym_idx < 0).any():
+		raise KeyError(trades.Symbol.values[sym_idx < 0][0])
+	shares = np.where(trades.Order.values == "BUY", 1, -1) * trades.Shares.values
+	return day_idx, sym_idx, shares
+
+def replay_orders(day_idx, sym_idx, shares, prices, start_val, allowed_leverage=2.0, testing=False, verbose=True):
+	"""Apply the orders in sequence and return a boolean array marking the ones
+	accepted. Orders that push leverage to @allowed_leverage or above are
+	rejected, as are orders that leave negative cash when @testing. Rejections
+	are reported unless @verbose is False."""
+	accepted = np.zeros(len(shares), dtype=bool)
+	holdings = np.zeros(prices.shape[1])
 	shorts = longs = 0
-	time_own = portfolio.iloc[0].copy()
-	cash= start_val
-	for i in range(trades.shape[0]):
-		sym = trades.iloc[i].Symbol
-		date = pd.to_datetime(trades.iloc[i].name)
-		price = portvals.ix[date, sym]
-		stock_order = trades.iloc[i].Order
-		n_shares = trades.iloc[i].Shares
+	cash = start_val
+	for i in range(len(shares)):
+		day, sym, n_shares = day_idx[i], sym_idx[i], shares[i]
+		price = prices[day, sym]
 
 		#Store old portfolio in case order is rejected
 		longs0 = longs
 		shorts0 = shorts
 		cash0 = cash
-		time_own0 = time_own.copy()
-		
-		if stock_order == "BUY":
-			time_own[sym] += n_shares
-			cash -= n_shares*price
-		else:
-			time_own[sym] -= n_shares
-			cash += n_shares*price
-
-		longs = sum((time_own[time_own>0]*portvals.ix[date,:]).fillna(0.0))
-		shorts = sum((time_own[time_own<0]*portvals.ix[date,:]).fillna(0.0))
+
+		holdings[sym] += n_shares
+		cash -= n_shares*price
+
+		value = holdings*prices[day]
+		value[np.isnan(value)] = 0.0
+		longs = value[holdings>0].sum()
+		shorts = value[holdings<0].sum()
 		leverage = (longs + abs(shorts)) / (longs - abs(shorts) + cash)
-		if testing:
+		if testing and verbose:
 			print "Longs:\t\t{}".format(longs)
 			print "Shorts:\t\t{}".format(shorts)
 			print "Cash:\t\t{}".format(cash)
@@ -70,49 +130,70 @@ def compute_portvals(orders_file = "./orders/orders.csv", start_val = 1000000, a
 		
 		if leverage >= allowed_leverage:
 			shorts, longs, cash = shorts0, longs0, cash0
-			time_own = time_own0.copy()
-			print "LEVERAGE EXCEEDED"
-			print "Potential Leverage:\t{}".format(leverage)
-			print "REJECTING ORDER"
-			print "Reset Leverage:\t{}".format((longs + abs(shorts)) / (longs - abs(shorts) + cash))
+			holdings[sym] -= n_shares
+			if verbose:
+				print "LEVERAGE EXCEEDED"
+				print "Potential Leverage:\t{}".format(leverage)
+				print "REJECTING ORDER"
+				print "Reset Leverage:\t{}".format((longs + abs(shorts)) / (longs - abs(shorts) + cash))
 			continue
 		
 		if cash<0 and testing:
 			bad_cash = cash
 			shorts, longs, cash = shorts0, longs0, cash0
-			time_own = time_own0.copy()
-			print "CASH EXCEEDED"
-			print "Potential Cash:\t{}".format(bad_cash)
-			print "REJECTING ORDER"
-			print "Reset Cash:\t{}".format(cash)
+			holdings[sym] -= n_shares
+			if verbose:
+				print "CASH EXCEEDED"
+				print "Potential Cash:\t{}".format(bad_cash)
+				print "REJECTING ORDER"
+				print "Reset Cash:\t{}".format(cash)
 			continue
-		
-		if stock_order == "BUY":
-			on_hand.ix[date, sym] -= n_shares*price
-			portfolio.ix[date, sym] += n_shares
-		else:
-			on_hand.ix[date, sym] += n_shares*price
-			portfolio.ix[date, sym] -= n_shares
+		accepted[i] = True
+	return accepted
 
-	
-	cash = np.sum(on_hand, axis=1)
+def orders_frame(orders, symbol=None):
+	"""Returns @orders as a frame indexed by date with Symbol, Order and Shares
+	columns. @orders may be such a frame or a structured array of ORDER_DTYPE."""
+	if isinstance(orders, np.ndarray):
+		orders = pd.DataFrame.from_records(orders, index="Date")
+	else:
+		orders = orders.copy()
+	orders.index = pd.to_datetime(orders.index)
+	orders.index.name = "Date"
+	if symbol is not None:
+		orders["Symbol"] = symbol
+	return orders[["Symbol", "Order", "Shares"]]
 
-	for i in range(on_hand.shape[0]):
-		if i==0:
-			cash.iloc[i] += start_val
-		else:
-			cash.iloc[i] += cash.iloc[i-1]
-			portfolio.iloc[i] += portfolio.iloc[i-1]
+def simulate_orders(orders, start_val=1000, allowed_leverage=2.0, testing=False, plotting=False):
+	"""Simulate a separate fund for each symbol in @orders, a dict of symbol to
+	orders (frames or ORDER_DTYPE arrays), priced from one shared price matrix.
+	Returns a frame of fund statistics indexed by symbol, along with the
+	cumulative return and sharpe ratio of the symbol itself as a benchmark.
+	With @plotting each fund is plotted against its symbol to figures/."""
+	columns = ["Cumulative_Return", "Sharpe_Ratio", "Std_Daily_Return",
+			   "Avg_Daily_Return", "Final_Value",
+			   "Bench_Cumulative_Return", "Bench_Sharpe_Ratio"]
+	symbols = sorted(orders)
+	prices = get_prices(symbols, fill=False)
+	results = []
+	for sym in symbols:
+		trades = orders_frame(orders[sym], sym)
+		if trades.shape[0] == 0:
+			continue
+		sym_prices = prices[[sym]].dropna().ix[trades.index.min():,:]
+		portvals, _ = simulate_portfolio(trades, sym_prices, start_val, allowed_leverage=allowed_leverage,
+										 testing=testing, verbose=False)
+		portvals = portvals[portvals.columns[0]]
+		cum_ret, avg_daily_ret, std_daily_ret, sharpe_ratio = get_portfolio_stats(portvals, 0.0, 252)
+		cum_ret_sym, _, _, sharpe_ratio_sym = get_portfolio_stats(sym_prices[sym], 0.0, 252)
+		if plotting:
+			plot_normalized(sym_prices[[sym]].join(portvals), sym)
+			plt.close()
+		results.append([sym, cum_ret, sharpe_ratio, std_daily_ret, avg_daily_ret,
+						portvals.iloc[-1], cum_ret_sym, sharpe_ratio_sym])
+	results = pd.DataFrame(results, columns=["Symbol"]+columns)
+	return results.set_index("Symbol")
 
-	portfolio = portfolio*portvals
-	portfolio = np.sum(portfolio, axis=1)
-	
-	# 7 Scan cash and value to create total fund value
-	portvals = pd.DataFrame(portfolio + cash)
-	portvals.columns = ["Portfolio"]
-	print "Ending Cash Value = ${}".format( cash.iloc[-1] )
-	return portvals
-	
 def get_portfolio_value(prices, allocs, start_val):
 	"""Given a starting value and prices of
 stocks in portfolio with allocations
@@ -1,5 +1,5 @@
 import time
-from dataset_construction import populate_webdata
+from dataset_construction import populate_webdata, build_price_store
 
 """Populates the /webdata folder with new data gathered from Yahoo Finance."""
 if __name__=="__main__":
@@ -7,4 +7,8 @@ if __name__=="__main__":
 	populate_webdata(replace=True)
 	print
 	print "%s seconds to download S&P 500 data." % (time.time() - start_time)
+	print
+	start_time = time.time()
+	build_price_store()
+	print "%s seconds to build the price store." % (time.time() - start_time)
 	print
\ No newline at end of file
@@ -7,6 +7,7 @@ import math, os, sys
 
 # Import Learners
 from learners import LinRegLearner as lrl
+from learners import BatchLinRegLearner as blr
 from learners import BagLearner as bag
 from learners import KNNLearner as knn
 # from learners import SVMLearner as svm
@@ -25,12 +26,77 @@ from dataset_construction import create_input, create_output, get_and_store_web_
 from helpers.error_metrics import rmse, mape
 
 # Import normalization
-from helpers.normalization import mean_normalization
+from helpers.normalization import MeanNormalizer
 
 
 
-def predict_spy_future(symbol= None, horizon=5, learner=None, use_prices=False, verbose=False):
-	"""Predict future prices or returns over a user defined horizon and machine learner."""
+skip_symbols = set(["ADT","NEE","WLTW","ARG","BXLT","SNDK","SNI","UA.C"]) #Something about ADT and NEE screws up the results
+six_months = 5*4*6 # 5 trading days/week * 4 weeks/month * 6 months
+
+def symbol_features(sym, horizon=5, use_prices=False):
+	"""Returns the feature frame of @sym and the feature frame joined with its
+	future returns (or prices). Every symbol gets the same feature layout."""
+##	features = create_input(sym, [Weekdays(), Bollinger(18), SMA(10), Lag(3)], store=False)
+##	features = create_input(sym, [Weekdays(), Lag(1), SMA(2), SMA(4)], store=False)
+	features = get_and_store_web_data(sym, online=False)
+	features["HmL_{}".format(sym)] = features["High_{}".format(sym)]-features["Low_{}".format(sym)]
+	features["OmC_{}".format(sym)] = features["Open_{}".format(sym)]-features["Close_{}".format(sym)]
+	features[["AdjClose_{}".format(sym),"Volume_{}".format(sym)]] = features[["AdjClose_{}".format(sym),"Volume_{}".format(sym)]].pct_change()
+	output = create_output(sym, horizon=horizon, use_prices=use_prices)
+	df = features.join(output).dropna()
+	return features, df
+
+def future_training_data(features, data, normalizer=None):
+	"""Returns the last six months of features and outputs, and today's features,
+	normalized by the first 90% of @data, to train the future prediction on.
+	A @normalizer already fitted on those rows is reused."""
+	if normalizer is None:
+		train_rows = int(math.floor(0.9* data.shape[0]))
+		normalizer = MeanNormalizer().fit(data[:train_rows,0:-1])
+	six_month_data = normalizer.transform(features.iloc[-six_months:].values)
+	six_month_output = data[-six_months:,-1]
+	todays_values = normalizer.transform(features.iloc[-1].values)
+	return six_month_data, six_month_output, todays_values
+
+def predict_spy_linreg(symbols=None, horizon=5, use_prices=False):
+	"""Predict future returns (or prices) of many symbols with the linear regression
+	of predict_spy_future, fitting the models of all symbols in one batched solve.
+	Symbols whose data can not be prepared are reported and left out.
+	Returns a Series of predictions indexed by symbol."""
+	if symbols is None:
+		symbols = list(pd.read_csv("spy_list.csv").Symbols)
+	fitted, trainX, trainY, todays = [], [], [], []
+	for sym in symbols:
+		if sym in skip_symbols: continue
+		try:
+			features, df = symbol_features(sym, horizon, use_prices)
+			six_month_data, six_month_output, todays_values = future_training_data(features, df.values)
+		except Exception, e:
+			print str(e)
+			continue
+		fitted.append(sym)
+		trainX.append(six_month_data)
+		trainY.append(six_month_output)
+		todays.append(todays_values)
+	learner = blr.BatchLinRegLearner()
+	learner.addEvidence(trainX, trainY)
+	return pd.Series(learner.query(np.array(todays)), index=fitted)
+
+def ensemble_predict(learners, trainX, trainY, testX):
+	"""Average the predictions of @learners, a list of (learner, copies) pairs.
+	Copies of a deterministic learner trained on the same data make the same
+	predictions, so each learner is fitted once and counted copies times."""
+	predY = None
+	for learn, copies in learners:
+		learn.addEvidence(trainX, trainY)
+		pred = learn.query(testX)
+		for i in range(copies):
+			predY = pred.copy() if predY is None else predY + pred
+	return predY/sum(copies for learn, copies in learners)
+
+def predict_spy_future(symbol= None, horizon=5, learner=None, use_prices=False, verbose=False, store=True):
+	"""Predict future prices or returns over a user defined horizon and machine learner.
+	The full results are written to return_results.csv (or price_results.csv) if @store."""
 	if not symbol:
                 fhand = pd.read_csv("spy_list.csv")
                 spy_list = list(fhand.Symbols)
@@ -55,15 +121,8 @@ def predict_spy_future(symbol= None, horizon=5, learner=None, use_prices=False,
 					  'TestCorr': np.nan}, ignore_index=True)
 
 	for sym in spy_list:
-		if sym in set(["ADT","NEE","WLTW","ARG","BXLT","SNDK","SNI","UA.C"]): continue #Something about ADT and NEE screws up the results
-##		features = create_input(sym, [Weekdays(), Bollinger(18), SMA(10), Lag(3)], store=False)
-##		features = create_input(sym, [Weekdays(), Lag(1), SMA(2), SMA(4)], store=False)
-		features = get_and_store_web_data(sym, online=False)
-		features["HmL_{}".format(sym)] = features["High_{}".format(sym)]-features["Low_{}".format(sym)]
-		features["OmC_{}".format(sym)] = features["Open_{}".format(sym)]-features["Close_{}".format(sym)]
-		features[["AdjClose_{}".format(sym),"Volume_{}".format(sym)]] = features[["AdjClose_{}".format(sym),"Volume_{}".format(sym)]].pct_change()
-		output = create_output(sym, horizon=horizon, use_prices=use_prices)
-		df = features.join(output).dropna()
+		if sym in skip_symbols: continue
+		features, df = symbol_features(sym, horizon, use_prices)
 
 		data = df.values
 		cols = [col for col in df.columns if not col.startswith("Returns")]
@@ -77,26 +136,17 @@ def predict_spy_future(symbol= None, horizon=5, learner=None, use_prices=False,
 		trainY = data[:train_rows,-1]
 		testX = data[train_rows:,0:-1]
 		testY = data[train_rows:,-1]
-		trainX, testX = mean_normalization(trainX, testX)
+		normalizer = MeanNormalizer().fit(trainX)
+		trainX, testX = normalizer.transform(trainX), normalizer.transform(testX)
 		
 		if not learner:
-			learners = [
-			lrl.LinRegLearner(),
-                        lrl.LinRegLearner(),
-                        lrl.LinRegLearner(),
-                        lrl.LinRegLearner(),
-			knn.KNNLearner(k=55)
-			]
+			# the linear regression counts four times in the average
+			learners = [(lrl.LinRegLearner(), 4), (knn.KNNLearner(k=55), 1)]
 		else:
-			learners = [learner()]
+			learners = [(learner(), 1)]
 		
-		learners[0].addEvidence(trainX, trainY)
-		predY = learners[0].query(testX)
-		for learn in learners[1:]:
-			learn.addEvidence(trainX, trainY)
-			# evaluate out of sample
-			predY += learn.query(testX)
-		predY = predY/len(learners)
+		# evaluate out of sample
+		predY = ensemble_predict(learners, trainX, trainY, testX)
 		
 		# Calculate TEST Root Mean Squared Error
 		RMSE = rmse(testY,predY)
@@ -116,26 +166,12 @@ def predict_spy_future(symbol= None, horizon=5, learner=None, use_prices=False,
 		else:
 			bench = mape(testY, df[[col for col in df.columns if col.startswith("Adj")]].values[train_rows:,-1])
 
-		six_months = 5*4*6 # 5 trading days/week * 4 weeks/month * 6 months
-		_, six_month_data = mean_normalization(data[:train_rows,0:-1], features.iloc[-six_months:].values)
-		six_month_output = data[-six_months:,-1]
-		_, todays_values = mean_normalization(data[:train_rows,0:-1], features.iloc[-1].values)
+		six_month_data, six_month_output, todays_values = future_training_data(features, data, normalizer)
 		if not learner:
-			learners = [
-			lrl.LinRegLearner(),
-                        lrl.LinRegLearner(),
-                        lrl.LinRegLearner(),
-                        lrl.LinRegLearner(),
-			knn.KNNLearner(k=15)
-			]
+			learners = [(lrl.LinRegLearner(), 4), (knn.KNNLearner(k=15), 1)]
 		else:
-			learners = [learner()]
-		learners[0].addEvidence(six_month_data, six_month_output)
-		future_pred = learners[0].query(todays_values.reshape(1,-1))
-		for learn in learners[1:]:
-                        learn.addEvidence(six_month_data, six_month_output)
-			future_pred += learn.query(todays_values.reshape(1,-1))
-		future_pred = future_pred/len(learners)
+			learners = [(learner(), 1)]
+		future_pred = ensemble_predict(learners, six_month_data, six_month_output, todays_values.reshape(1,-1))
 		
 		if not use_prices:
 			results = results.append( {
@@ -166,12 +202,14 @@ def predict_spy_future(symbol= None, horizon=5, learner=None, use_prices=False,
 		results	= results.sort_values(by=["TestError(RMSE)"],ascending=True)
 		results = results[["Date","ReturnDate","Symbol", "Return","TestError(RMSE)","Bench_0(RMSE)","TestCorr"]]
 		results.columns = ["Date","Return_Date","Symbol", "Return(%)","Test_Error(RMSE)","Bench_0(RMSE)","Test_Corr"]
-		results.to_csv('return_results.csv', index="Date")
+		if store:
+			results.to_csv('return_results.csv', index="Date")
 	else:
 		results	= results.sort_values(by=["TestError(MAPE)"],ascending=True)
 		results = results[["Date","FutureDate","Symbol", "Future_Price","TestError(MAPE)","Bench_Last_Price(MAPE)","TestCorr"]]
 		results.columns = ["Date","Future_Date","Symbol", "Future_Price($)","Test_Error(MAPE)","Bench_Last_Price(MAPE)","Test_Corr"]
-		results.to_csv('price_results.csv', index="Date")
+		if store:
+			results.to_csv('price_results.csv', index="Date")
 	results = results.set_index("Date")
 	return results.iloc[:10]
 
@@ -181,4 +219,8 @@ if __name__=="__main__":
 	except (IndexError, ValueError):
 		horizon = 5
 	
-	print predict_spy_future(horizon=horizon)
+	# pass linreg after the horizon to fit only the linear regressions, all at once
+	if len(sys.argv) > 2 and sys.argv[2].lower() == "linreg":
+		print predict_spy_linreg(horizon=horizon).sort_values(ascending=False).iloc[:10]
+	else:
+		print predict_spy_future(horizon=horizon)
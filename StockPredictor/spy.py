@@ -1,31 +1,33 @@
-import os
+import os, sys
 import pandas as pd
 import numpy as np
+from functools import partial
+from multiprocessing import Pool
 from random import sample
 
 from learner_strategy import learner_strategy
-from marketsim import compute_portvals, test_code
+from marketsim import simulate_orders
 from learners.LinRegLearner import LinRegLearner as lrl
 from learners.KNNLearner import KNNLearner as knn
 from helpers.normalization import mean_normalization
 from dataset_construction import get_and_store_web_data, create_input, create_output
 from predict_future import predict_spy_future
 
-fhand = pd.read_csv("spy_list.csv")
-spy_list = list(fhand.Symbols)
-# spy_list = sample(spy_list,15)
-
 # Learner Strategy args = [1]symbol [2]horizon [3]threshold [4]num_shares [5]shorting?
 horizon=5
 shares=10
 shorting=True
 threshold=0.01
+start_val=1000
 
 #   os.system('python learner_strategy.py {0:} 5 0.01 10 T'.format(i))
 #   # Market Simulator args = [1]create a plot [2]portfolio start value
 #   os.system('python marketsim.py T 1000')
 
-for _, i in enumerate(spy_list):
+def process_symbol(i, plotting=False):
+    """Fit the learners, predict returns, create orders and simulate them for
+    symbol @i, plotting the fund to figures/ if @plotting. Returns a one row
+    frame of results, or None if anything fails."""
     try:
         ibm_future_returns = create_output(i, use_prices=False)
         ibm_future_returns.columns = ["Returns_{}".format(i)]
@@ -75,19 +77,51 @@ for _, i in enumerate(spy_list):
         returns = dframe.Predicted.dropna()
         returns = returns.to_frame()
         returns.columns = ["Returns"]
-        predict_spy_future(symbol=i, horizon=horizon, use_prices=False)
+        future = predict_spy_future(symbol=i, horizon=horizon, use_prices=False, store=False)
 
-        symbol = i
-        horizon = 5
-        num_shares = 10
-        orders_file = "./orders/learner_orders.csv"
-        start_val = 1000
-        learner_strategy(data = returns, 
-                         threshold = 0.01, 
-                         sym = symbol, 
-                         horizon = horizon, 
-                         num_shares = num_shares, 
-                         shorting = True)
-        test_code(of = orders_file, sv = start_val, plotting="T", testing=True)
+        orders = learner_strategy(data = returns, 
+                                  threshold = threshold, 
+                                  sym = i, 
+                                  horizon = horizon, 
+                                  num_shares = shares, 
+                                  shorting = shorting,
+                                  store = False,
+                                  as_array = True)
+        results = simulate_orders({i: orders}, start_val = start_val, testing = True, plotting = plotting)
+        results["Predicted_Return"] = future["Return(%)"].values[0] if future.shape[0] else np.nan
+        return results
     except Exception, e:
-        print str(e)
\ No newline at end of file
+        print str(e)
+        return None
+
+def run_sweep(symbols, processes=None, filename="spy_results.csv", plotting=False):
+    """Process @symbols over a pool of @processes workers (one per cpu by
+    default) and write the results of every symbol that succeeded to @filename.
+    With @plotting each symbol's fund is plotted as process_symbol does.
+    Workers read prices from the memory-mapped price store, so its pages are
+    shared between them."""
+    if processes == 1:
+        results = [process_symbol(sym, plotting) for sym in symbols]
+    else:
+        pool = Pool(processes)
+        try:
+            results = pool.map(partial(process_symbol, plotting=plotting), symbols, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    results = [res for res in results if res is not None]
+    results = pd.concat(results) if results else pd.DataFrame()
+    results.to_csv(filename, index_label="Symbol")
+    return results
+
+if __name__ == "__main__":
+    try:
+        processes = int(sys.argv[1])
+    except (IndexError, ValueError):
+        processes = None
+    # pass T after the number of processes to plot each symbol's fund
+    plotting = len(sys.argv) > 2 and sys.argv[2].lower() == "t"
+    fhand = pd.read_csv("spy_list.csv")
+    spy_list = list(fhand.Symbols)
+    # spy_list = sample(spy_list,15)
+    print run_sweep(spy_list, processes=processes, plotting=plotting)
@@ -3,7 +3,9 @@ import numpy as np
 import datetime as dt
 import matplotlib.pyplot as plt
 import os
-from util import get_data, plot_data
+from helpers.util import get_data, plot_data
+from indicators.intermediates import Intermediates
+from strategy import Strategy, FixedShares
 
 def bollinger_bands(data, window=20):
 	sma = pd.DataFrame( pd.rolling_mean(data, window=window))
@@ -16,6 +18,93 @@ def bollinger_bands(data, window=20):
 	df = data.join(sma.join(upper).join(lower))
 	return df
 
+def bollinger_events(panel, window=20):
+	"""Returns the long entry, long exit, short entry and short exit events of
+	a symbols x dates price panel, as boolean arrays shaped like it. They are
+	the price crossing back above the lower band, up through the moving
+	average, back below the upper band and down through the moving average."""
+	shared = Intermediates(panel)
+	sma = shared.rolling_mean(window).values.T
+	std = shared.rolling_std(window).values.T
+	upper, lower = sma + 2*std, sma - 2*std
+	prices = np.atleast_2d(panel)
+	before, now = prices[:,:-1], prices[:,1:]
+	events = [np.zeros(prices.shape, dtype=bool) for i in range(4)]
+	with np.errstate(invalid="ignore"):
+		events[0][:,1:] = (before < lower[:,:-1]) & (now >= lower[:,1:])
+		events[1][:,1:] = (before < sma[:,:-1]) & (now >= sma[:,1:])
+		events[2][:,1:] = (before > upper[:,:-1]) & (now <= upper[:,1:])
+		events[3][:,1:] = (before > sma[:,:-1]) & (now <= sma[:,1:])
+	return events
+
+def _next_event(events):
+	"""For every bar, the first bar at or after it with an event, or the
+	number of bars if there is none. Two bars past the end are added."""
+	n = events.shape[1]
+	bars = np.where(events, np.arange(n), n)
+	following = np.full((events.shape[0], n+2), n, dtype=int)
+	following[:,:n] = np.minimum.accumulate(bars[:,::-1], axis=1)[:,::-1]
+	return following
+
+def bollinger_trades(panel, window=20):
+	"""
+	@summary: Trade the Bollinger bands of every symbol of a symbols x dates
+	price panel, as bollinger_plot does. Without a position, a symbol goes short
+	when its price falls back below the upper band and long when it rises back
+	above the lower band. A short is covered when the price falls through the
+	moving average, and a long sold when it rises through it.
+	@returns arrays of the symbol row, date column and direction (1 to buy, -1
+	to sell) of every order, sorted by symbol and date.
+	"""
+	long_entry, long_exit, short_entry, short_exit = [_next_event(e) for e in bollinger_events(panel, window)]
+	n = long_entry.shape[1] - 2
+	sym_idx, day_idx, signs = [], [], []
+	# instead of stepping through the bars, every pass jumps all symbols still
+	# trading to their next entry and the exit that follows it
+	active = np.arange(long_entry.shape[0])
+	start = np.ones(active.shape[0], dtype=int)
+	while active.shape[0]:
+		long_at, short_at = long_entry[active, start], short_entry[active, start]
+		entry = np.minimum(long_at, short_at)
+		opened = entry < n
+		active, entry, is_long = active[opened], entry[opened], (long_at < short_at)[opened]
+		exit = np.where(is_long, long_exit[active, entry+1], short_exit[active, entry+1])
+		sym_idx.append(active)
+		day_idx.append(entry)
+		signs.append(np.where(is_long, 1, -1))
+		closed = exit < n
+		sym_idx.append(active[closed])
+		day_idx.append(exit[closed])
+		signs.append(np.where(is_long, -1, 1)[closed])
+		active, start = active[closed], exit[closed] + 1
+	sym_idx, day_idx, signs = [np.concatenate(a) for a in (sym_idx, day_idx, signs)]
+	order = np.lexsort((day_idx, sym_idx))
+	return sym_idx[order], day_idx[order], signs[order]
+
+class BollingerSignal(object):
+	"""Strategy signal of the Bollinger band trades: 1 while long, -1 while
+	short and 0 without a position."""
+
+	def __init__(self, window=20):
+		self.window = window
+
+	def signal(self, prices, predictions=None):
+		sym_idx, day_idx, signs = bollinger_trades(prices, self.window)
+		changes = np.zeros(np.atleast_2d(prices).shape)
+		changes[sym_idx, day_idx] = signs
+		return np.cumsum(changes, axis=1)
+
+def bollinger_orders(panel, dates, symbols, window=20, shares=100):
+	"""Returns a dict of each of @symbols to its Bollinger band orders, as
+	ORDER_DTYPE arrays simulate_orders takes."""
+	return Strategy(BollingerSignal(window), FixedShares(shares)).orders(panel, dates, symbols)
+
+def backtest_bollinger(symbols, window=20, shares=100, start_val=10000):
+	"""Backtest the Bollinger band strategy on each of @symbols, computed for
+	all of them at once from one price panel. Returns simulate_orders' frame
+	of fund statistics."""
+	return Strategy(BollingerSignal(window), FixedShares(shares)).backtest(symbols, start_val=start_val)
+
 def bollinger_plot(data):
 	b_bands = bollinger_bands(data)
 	sym = data.columns.values[0]
@@ -29,55 +118,17 @@ def bollinger_plot(data):
 	plt.title("{} Adjusted Close".format(sym))
 	plt.ylabel("{} Prices".format(sym))
 	
-	position = None
 	print "Date,Symbol,Order,Shares"
-	for i in range(1,b_bands.shape[0]):
-		#Long Entry Signal
-		below_lower_before = (data.iloc[i-1]<b_bands["LOWER"].iloc[i-1]).values
-		above_lower_now = (data.iloc[i]>=b_bands["LOWER"].iloc[i]).values
-		long_entry = below_lower_before and above_lower_now
-		#Long Exit Signal
-		below_sma_before = (data.iloc[i-1]<b_bands["SMA"].iloc[i-1]).values
-		above_sma_now = (data.iloc[i]>=b_bands["SMA"].iloc[i]).values
-		long_exit = below_sma_before and above_sma_now and position=="Long"
-		#Short Entry Signal
-		above_upper_before = (data.iloc[i-1]>b_bands["UPPER"].iloc[i-1]).values
-		below_upper_now = (data.iloc[i]<=b_bands["UPPER"].iloc[i]).values
-		short_entry = above_upper_before and below_upper_now
-		#Short Exit Signal
-		above_sma_before = (data.iloc[i-1]>b_bands["SMA"].iloc[i-1]).values
-		below_sma_now = (data.iloc[i]<=b_bands["SMA"].iloc[i]).values
-		short_exit = above_sma_before and below_sma_now and position=="Short"
-		if position == None:
-			#Short Entry
-			if short_entry:
-				plt.axvline(x=data.index[i], color="r", linewidth=1)
-				position = "Short"
-				#issue sell order
-				print "{0},{1},SELL,100".format(data.index[i].strftime("%Y-%m-%d"),
-												sym)
-			#Long Entry
-			if long_entry:
-				plt.axvline(x=data.index[i], color="g", linewidth=1)
-				position = "Long"
-				#issue buy order
-				print "{0},{1},BUY,100".format(data.index[i].strftime("%Y-%m-%d"),
-												sym)
+	sym_idx, day_idx, signs = bollinger_trades(data.values.T)
+	for k, (day, sign) in enumerate(zip(day_idx, signs)):
+		# orders alternate between entering and exiting a position
+		if k % 2:
+			color = "k"
 		else:
-			#Short Exit
-			if short_exit:
-				plt.axvline(x=data.index[i], color="k", linewidth=1)
-				position = None
-				#issue buy order
-				print "{0},{1},BUY,100".format(data.index[i].strftime("%Y-%m-%d"),
-												sym)
-			#Long Exit
-			if long_exit:
-				plt.axvline(x=data.index[i], color="k", linewidth=1)
-				position = None
-				#issue sell order
-				print "{0},{1},SELL,100".format(data.index[i].strftime("%Y-%m-%d"),
-												sym)
+			color = "g" if sign > 0 else "r"
+		plt.axvline(x=data.index[day], color=color, linewidth=1)
+		print "{0},{1},{2},100".format(data.index[day].strftime("%Y-%m-%d"), sym,
+									   "BUY" if sign > 0 else "SELL")
 	plt.show()
 	
 def test_code():
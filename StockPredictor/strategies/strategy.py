@@ -0,0 +1,146 @@
+"""
+Trading strategies as stages over symbols x dates arrays.
+
+A strategy is a signal, a sizing and any number of risk filters, each of
+which takes and returns whole panels:
+
+	signal.signal(prices, predictions) -> which way to hold each symbol on
+		each date, 1 long, -1 short, 0 flat (or more or less than 1 unit)
+	sizing.size(signal, prices) -> shares held
+	risk_filter.filter(shares, prices) -> shares held, cut down
+
+Orders are the changes in the shares held, returned as ORDER_DTYPE arrays
+that simulate_orders takes in memory, so a new strategy needs no loop over
+bars and no orders file.
+"""
+
+import numpy as np
+import pandas as pd
+from dataset_construction import load_price_panel
+from marketsim import ORDER_DTYPE, simulate_orders
+
+def split_orders(sym_idx, day_idx, shares, dates, symbols):
+	"""Returns a dict of each of @symbols to its orders as an ORDER_DTYPE
+	array, from arrays of the symbol row, date column and shares (negative to
+	sell) of every order, sorted by symbol and date."""
+	orders = np.zeros(sym_idx.shape[0], dtype=ORDER_DTYPE)
+	orders["Date"] = np.asarray(dates, dtype="M8[ns]")[day_idx]
+	orders["Order"] = np.where(shares > 0, "BUY", "SELL")
+	orders["Shares"] = np.abs(shares)
+	bounds = np.searchsorted(sym_idx, np.arange(len(symbols)+1))
+	return dict((sym, orders[bounds[i]:bounds[i+1]]) for i, sym in enumerate(symbols))
+
+def hold_unpriced(positions, prices):
+	"""Returns @positions held unchanged over the dates a symbol has no price,
+	and flat before its first price, since no order can fill there."""
+	positions = np.where(np.isnan(prices), np.nan, positions)
+	return pd.DataFrame(positions).ffill(axis=1).fillna(0).values
+
+def positions_to_orders(positions, dates, symbols):
+	"""Returns the orders that move each symbol through @positions, a symbols
+	x dates array of the shares held after each date, as split_orders does."""
+	trades = np.diff(positions, axis=1, prepend=0)
+	sym_idx, day_idx = np.nonzero(trades)
+	return split_orders(sym_idx, day_idx, trades[sym_idx, day_idx], dates, symbols)
+
+class PredictionSignal(object):
+	"""Trades predicted returns as learner_strategy does. A prediction above
+	@threshold is held long for @horizon dates (short below -@threshold when
+	@shorting), two units beyond 5*@threshold. Trades that would still be open
+	at the end of the data are not taken, and overlapping trades add up."""
+
+	def __init__(self, threshold=0.05, horizon=5, shorting=False):
+		self.threshold = threshold
+		self.horizon = horizon
+		self.shorting = shorting
+
+	def signal(self, prices, predictions):
+		pred = np.atleast_2d(np.asarray(predictions, dtype=float))
+		with np.errstate(invalid="ignore"):
+			multiplier = np.where(np.abs(pred)>5*self.threshold, 2, 1)
+			longs = pred>self.threshold
+			shorts = (pred<-self.threshold) & self.shorting & ~longs
+		trades = np.where(longs, multiplier, np.where(shorts, -multiplier, 0)).astype(float)
+		trades[:, max(pred.shape[1]-self.horizon, 0):] = 0
+		# the trades opened over the last horizon dates
+		opened = np.cumsum(trades, axis=1)
+		held = opened.copy()
+		if self.horizon > 0:
+			held[:, self.horizon:] -= opened[:, :-self.horizon]
+		else:
+			held[:] = 0
+		return held
+
+class FixedShares(object):
+	"""@shares per unit of signal."""
+
+	def __init__(self, shares=100):
+		self.shares = shares
+
+	def size(self, signal, prices):
+		return signal*self.shares
+
+class FixedValue(object):
+	"""Whole shares worth @value per unit of signal, at the price of the date
+	the signal last changed, so a position is not resized as its price moves."""
+
+	def __init__(self, value=10000):
+		self.value = value
+
+	def size(self, signal, prices):
+		changed = np.ones(signal.shape, dtype=bool)
+		changed[:, 1:] = signal[:, 1:] != signal[:, :-1]
+		entry_prices = pd.DataFrame(np.where(changed, prices, np.nan)).ffill(axis=1).values
+		return np.trunc(signal*self.value/entry_prices)
+
+class MaxPosition(object):
+	"""Caps the shares held of each symbol at @shares, long or short."""
+
+	def __init__(self, shares=1000):
+		self.shares = shares
+
+	def filter(self, positions, prices):
+		return np.clip(positions, -self.shares, self.shares)
+
+class LongOnly(object):
+	"""Stays flat instead of going short."""
+
+	def filter(self, positions, prices):
+		return np.maximum(positions, 0)
+
+class Strategy(object):
+
+	def __init__(self, signal, sizing=None, filters=()):
+		"""
+		@param signal: stage with signal(prices, predictions)
+		@param sizing: stage with size(signal, prices), FixedShares() by default
+		@param filters: stages with filter(positions, prices), applied in order
+		"""
+		self.signal = signal
+		self.sizing = sizing if sizing is not None else FixedShares()
+		self.filters = list(filters)
+
+	def positions(self, prices, predictions=None):
+		"""
+		@summary: Run the stages over a panel.
+		@param prices: symbols x dates prices, NaN where a symbol has no price
+		@param predictions: optional symbols x dates predictions aligned with @prices
+		@returns the symbols x dates shares held after each date.
+		"""
+		prices = np.atleast_2d(np.asarray(prices, dtype=float))
+		positions = self.sizing.size(self.signal.signal(prices, predictions), prices)
+		for risk_filter in self.filters:
+			positions = risk_filter.filter(positions, prices)
+		return hold_unpriced(positions, prices)
+
+	def orders(self, prices, dates, symbols, predictions=None):
+		"""Returns a dict of each of @symbols to its ORDER_DTYPE orders."""
+		return positions_to_orders(self.positions(prices, predictions), dates, symbols)
+
+	def backtest(self, symbols, predictions=None, dates=None, start_val=1000, allowed_leverage=2.0):
+		"""Simulate the strategy on each of @symbols, priced from
+		load_price_panel(@symbols, @dates). @predictions must be aligned with
+		those dates. Returns simulate_orders' frame of fund statistics."""
+		panel, dates = load_price_panel(symbols, dates)
+		orders = self.orders(panel, dates, symbols, predictions)
+		return simulate_orders(orders, start_val=start_val, allowed_leverage=allowed_leverage)
@@ -22,12 +22,15 @@ from indicators.Volatility import Volatility
 from indicators.Lag import Lag
 from indicators.RSI import RSI
 from indicators.Weekdays import Weekdays
+from indicators.IndicatorBank import IndicatorBank
 # Import dataset constructor library
 from dataset_construction import create_input, create_output
 # Import data processing libraries
 from helpers.util import calculate_returns
 from helpers.error_metrics import rmse, mape
 from helpers.normalization import mean_normalization, max_normalization
+from helpers.walk_forward import walk_forward
+from indicator_search import score_dataset, search_combinations, select_indicators
 
 # from plotting import plot_histogram
 ##from learners import SVMLearner as svm
@@ -35,53 +38,45 @@ from helpers.normalization import mean_normalization, max_normalization
 def run_test(symbol, indicator_list, learner, plotting=False, verbose=False):
         dataX = create_input(symbol,indicators=indicator_list)
         dataY = create_output(symbol, use_prices=False)
-        data = dataX.join(dataY)
+        return test_dataset(dataX.join(dataY), learner, plotting, verbose,
+                            names=[ind.name for ind in indicator_list])
+
+def run_bank_test(symbol, bank, indicator_list, learner, plotting=False, verbose=False):
+        """run_test for indicators that are part of @bank. The bank's columns are
+        computed (and cached) once per symbol for all of its indicators."""
+        dataX = create_input(symbol, indicators=[bank])
+        prefixes = tuple(bank.prefix(ind) for ind in indicator_list)
+        cols = [col for col in dataX.columns if col.startswith("Adj")]
+        cols += [col for prefix in prefixes for col in dataX.columns if col.startswith(prefix)]
+        dataY = create_output(symbol, use_prices=False)
+        return test_dataset(dataX[cols].join(dataY), learner, plotting, verbose,
+                            names=[ind.name for ind in indicator_list])
+
+def test_dataset(data, learner, plotting=False, verbose=False, names=None):
+        """Train @learner on the first 60% of the rows of @data, features then
+        output, and test it on the rest."""
         df = data.dropna()
         data = data.dropna().values
         # compute how much of the data is training and testing
         train_rows = int(math.floor(0.6* data.shape[0]))
-        test_rows = int(data.shape[0] - train_rows)
-
-        # separate out training and testing data
-        trainX = data[:train_rows,0:-1]
-        trainY = data[:train_rows,-1]
-        testX = data[train_rows:,0:-1]
         testY = data[train_rows:,-1]
-        trainX, testX = mean_normalization(trainX, testX)
-        learner.addEvidence(trainX, trainY) # train it
-
-        # evaluate in sample
-        predYtrain = learner.query(trainX) # get the predictions
-        # Calculate TRAINING Root Mean Squared Error
-        train_rmse = rmse(trainY, predYtrain)
-        # Calculate TRAINING Mean Absolute Percent Error
-        train_mape = mape(trainY, predYtrain)
-        # Calculate correlation between predicted and TRAINING results
-        train_cor = np.corrcoef(predYtrain, y=trainY)
-
-        # evaluate out of sample
-        predY = learner.query(testX) # get the predictions
-        # Calculate TEST Root Mean Squared Error
-        test_rmse = rmse(testY,predY)
-        # Calculate TEST Mean Absolute Percent Error
-        test_mape = mape(testY, predY)
-        # Calculate correlation between predicted and TEST results
-        c = np.corrcoef(predY, y=testY)
+        predYtrain, predY, scores = score_dataset(data, learner)
+        c, train_cor, train_mape, test_mape, train_rmse, test_rmse = scores
         
         if verbose:
-                print [ind.name for ind in indicator_list]
+                print names
                 print predYtrain.shape
                 print
                 print "In sample results"
                 print "RMSE: ", train_rmse
                 if train_mape!=np.inf:
                         print "MAPE: ", train_mape
-                print "corr: ", train_cor[0,1]
+                print "corr: ", train_cor
                 print
                 print "Out of sample results"
                 print "RMSE: ", test_rmse
                 print "MAPE: ", test_mape
-                print "corr: ", c[0,1]
+                print "corr: ", c
                 print
         
         # Join predicted values and actual values into a dataframe.
@@ -106,7 +101,20 @@ def run_test(symbol, indicator_list, learner, plotting=False, verbose=False):
                 plt.ylabel("Actual Returns")
                 plt.show()
 
-        return predicted, c[0,1], train_cor[0,1], train_mape, test_mape, train_rmse, test_rmse
+        return predicted, c, train_cor, train_mape, test_mape, train_rmse, test_rmse
+
+def run_walk_forward(symbol, indicator_list, learner, window=250, step=1, horizon=5):
+        """Walk @learner forward over the indicators of @symbol, refitting on the
+        last @window rows every @step rows. Returns the predicted and actual
+        returns of every out of sample row, as run_test does for one split."""
+        dataX = create_input(symbol, indicators=indicator_list)
+        dataY = create_output(symbol, horizon=horizon, use_prices=False)
+        df = dataX.join(dataY).dropna()
+        data = df.values
+        # the last horizon-1 outputs of a window are not known on the first day predicted
+        results = walk_forward(data[:,0:-1], data[:,-1], learner, window, step, gap=horizon-1)
+        return pd.DataFrame({"Predicted": results["Predicted"], "Actual": results["Actual"]},
+                            columns=["Predicted", "Actual"], index=df.index[results["Row"]])
 
 def plot_error_curves(opt_var, train_error, test_error, error_type="RMSE"):
         testerr, = plt.plot(opt_var, test_error, label="Test Error")
@@ -117,40 +125,73 @@ def plot_error_curves(opt_var, train_error, test_error, error_type="RMSE"):
 	plt.title("{} Training and Test Curves".format(error_type))
 	plt.show()
 
-def test_indicator(horizon=5,test_one_indicator=True, verbose=False, plotting=False):
+def indicator_pool():
+        """The indicators test_indicator draws its sets from."""
+        return [
+                Bollinger(4), Bollinger(5), Bollinger(19),
+                ExponentialMA(2), ExponentialMA(4),
+                Lag(1), Lag(3),
+                Momentum(2), Momentum(3),
+                SimpleMA(4), SimpleMA(10),
+                RSI(10), Volatility(5),
+                Weekdays()
+                ]
+
+def search_indicators(mode="forward", max_size=5, width=5, indicators=None, processes=None):
+        """Stepwise ("forward" or "backward") or "beam" search for a good set of
+        @indicators (indicator_pool() by default) instead of scoring every set,
+        which grows too fast for large pools. Writes every set tried with its
+        testing RMSE summed over the symbols to best_indicators/<mode>_best.csv,
+        in the format of average_<n>_best.csv."""
+        fhand = pd.read_csv("spy_list.csv")
+        spy_list = list(fhand.Symbols)
+        if indicators is None:
+                indicators = indicator_pool()
+        tried = select_indicators(spy_list, indicators, mode=mode, max_size=max_size,
+                                  width=width, processes=processes)
+        sorted_indicators = pd.DataFrame(
+                {"Indicator":[", ".join([indicators[i].name for i in ind_set]) for ind_set in tried.keys()],
+                 "Error":tried.values()})
+        sorted_indicators.sort_values("Error", ascending=True, inplace=True)
+        sorted_indicators = sorted_indicators[["Indicator", "Error"]]
+        sorted_indicators.to_csv("best_indicators/{}_best.csv".format(mode))
+        return sorted_indicators
+
+def test_indicator(horizon=5,test_one_indicator=True, verbose=False, plotting=False,
+                   processes=None, checkpoint="best_indicators/search_checkpoint"):
+        """Score single indicators over their windows, or every set of up to 5
+        of 14 indicators. The sets are scored by indicator_search over a pool of
+        @processes workers, and the scores of finished symbols are kept in
+        @checkpoint until it is done, so an interrupted search resumes where it
+        stopped."""
         fhand = pd.read_csv("spy_list.csv")
 	spy_list = list(fhand.Symbols)
 	spy_length = len(spy_list)
 	use_prices=False
 	
+        # create a learner and train it
+        learner = lrl.LinRegLearner()
+
         # Get Indicators
         if test_one_indicator:
                 upper_length = 1
                 opt_var = range(2,21)
                 indicators = [[SimpleMA(i)] for i in opt_var]
+                # every window of a symbol comes from one indicator bank
+                bank = IndicatorBank(["SMA"], opt_var)
         else:
-                indicators = [
-                        Bollinger(4), Bollinger(5), Bollinger(19),
-                        ExponentialMA(2), ExponentialMA(4),
-                        Lag(1), Lag(3),
-                        Momentum(2), Momentum(3),
-                        SimpleMA(4), SimpleMA(10),
-                        RSI(10), Volatility(5),
-                        Weekdays()
-                        ]
+                indicators = indicator_pool()
                 for i in indicators: print i.name
-                empty_list = []
                 upper_length = 5
-                for j in range(1,upper_length+1):
-                    for i in combinations(indicators,j):
-                        empty_list.append(list(i))
-                indicators = empty_list
+                # each set is a tuple of indices into the indicators
+                index_sets = [i for j in range(1,upper_length+1)
+                              for i in combinations(range(len(indicators)),j)]
+                scores = search_combinations(spy_list, indicators, index_sets, learner,
+                                             processes=processes, checkpoint=checkpoint)
+                indicators = [[indicators[k] for k in i] for i in index_sets]
                 opt_var = range(len(indicators))
 ##                opt_var = [[ind.name for ind in indicator] for indicator in indicators]
         
-        # create a learner and train it
-        learner = lrl.LinRegLearner()
-
         best_ind_dict = {}
         all_ind_dict = {}
 	
@@ -160,12 +201,17 @@ def test_indicator(horizon=5,test_one_indicator=True, verbose=False, plotting=Fa
                 if use_prices: mapestrain, mapestest = [], []
                 
                 best_rmse = np.inf
-                for symbol in spy_list:
+                for s, symbol in enumerate(spy_list):
                         # Get stock data
                         filename= "webdata/{}.csv".format(symbol)
                         try:
                                 try:
-                                        predicted, c, train_cor, train_mape, test_mape, train_rmse, test_rmse = run_test(symbol, indicator, learner)
+                                        if test_one_indicator:
+                                                predicted, c, train_cor, train_mape, test_mape, train_rmse, test_rmse = run_bank_test(symbol, bank, indicator, learner)
+                                        else:
+                                                c, train_cor, train_mape, test_mape, train_rmse, test_rmse = scores[s, i]
+                                                if np.isnan(test_rmse):
+                                                        raise ValueError("{} could not be scored".format(symbol))
                                 except ValueError:
                                         spy_length -= 1
                                         continue
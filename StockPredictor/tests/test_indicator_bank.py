@@ -0,0 +1,50 @@
+"""
+Checks of IndicatorBank against the single indicators it stands in for.
+Run from StockPredictor with: python -m unittest discover -s tests
+"""
+
+import unittest
+import numpy as np
+import pandas as pd
+from indicators.IndicatorBank import IndicatorBank
+from indicators.SimpleMA import SimpleMA
+from indicators.Bollinger import Bollinger
+
+WINDOWS = range(2, 21)
+
+def returns_with_runs():
+    """Daily returns with runs of zero returns, as on days a price did not
+    move, a run of one repeated return and a missing value."""
+    values = np.random.RandomState(0).randn(300)*0.01
+    values[[40, 41, 100, 101, 102, 200, 201, 202, 203, 204, 205]] = 0
+    values[150:156] = 0.01
+    values[250] = np.nan
+    return pd.DataFrame(values, index=pd.bdate_range("2015-01-01", periods=300),
+                        columns=["AdjClose_X"])
+
+class IndicatorBankTest(unittest.TestCase):
+
+    def check_kind(self, kind, indicator_class):
+        data = returns_with_runs()
+        bank = IndicatorBank(kinds=(kind,), windows=WINDOWS)
+        bank.addEvidence(data)
+        bank_values = bank.getIndicator()
+        for window in WINDOWS:
+            indicator = indicator_class(window)
+            indicator.addEvidence(data)
+            expected = indicator.getIndicator()
+            name = expected.columns[0]
+            got, want = bank_values[name].values, expected[name].values
+            np.testing.assert_array_equal(np.isnan(got), np.isnan(want), err_msg=name)
+            np.testing.assert_array_equal(np.isinf(got), np.isinf(want), err_msg=name)
+            finite = np.isfinite(want)
+            np.testing.assert_allclose(got[finite], want[finite], rtol=1e-6, atol=1e-12, err_msg=name)
+
+    def test_sma_matches_simple_ma(self):
+        self.check_kind("SMA", SimpleMA)
+
+    def test_bollinger_matches_bollinger(self):
+        self.check_kind("Bollinger", Bollinger)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+"""
+Checks of the stepwise indicator search against the exhaustive one.
+Run from StockPredictor with: python -m unittest discover -s tests
+"""
+
+import unittest
+from itertools import combinations
+import numpy as np
+from indicators.Bollinger import Bollinger
+from indicators.ExponentialMA import ExponentialMA
+from indicators.Lag import Lag
+from indicators.Momentum import Momentum
+from indicators.RSI import RSI
+from indicators.SimpleMA import SimpleMA
+from indicator_search import score_combinations, select_indicators, symbol_gram, SCORES
+from learners.LinRegLearner import LinRegLearner
+
+# AFL has days without a price change, which make Lag and Momentum of its
+# returns infinite; GOOG has none
+SYMBOLS = ["AFL", "IBM", "GOOG", "AAPL"]
+
+def indicators():
+    return [SimpleMA(4), Bollinger(5), ExponentialMA(2), Lag(1), Momentum(2), RSI(10)]
+
+class SelectIndicatorsTest(unittest.TestCase):
+
+    def exhaustive_errors(self, sets):
+        # summed as test_indicator sums average_<n>_best.csv
+        test_rmse = np.array([score_combinations(symbol, indicators(), sets, LinRegLearner())
+                              for symbol in SYMBOLS])[:,:,SCORES.index("TestRMSE")]
+        errors = {}
+        for i, combination in enumerate(sets):
+            scored = test_rmse[:,i][test_rmse[:,i] < 4.0]
+            if scored.size:
+                errors[combination] = scored.sum()
+        return errors
+
+    def test_symbols_include_infinite_indicators(self):
+        finite = [symbol_gram(symbol, indicators())["finite"] for symbol in SYMBOLS]
+        self.assertFalse(finite[0][3])
+        self.assertTrue(finite[2][3])
+
+    def test_forward_search_picks_exhaustive_best(self):
+        sets = [c for size in (1, 2) for c in combinations(range(len(indicators())), size)]
+        errors = self.exhaustive_errors(sets)
+        tried = select_indicators(SYMBOLS, indicators(), mode="forward", max_size=2, processes=1)
+        self.assertEqual(min(tried, key=tried.get), min(errors, key=errors.get))
+        # every indicator of the pool was a candidate
+        self.assertEqual(set(c for c in tried if len(c) == 1), set(c for c in sets if len(c) == 1))
+        for combination, error in tried.items():
+            self.assertAlmostEqual(error, errors[combination], places=10)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+"""
+Checks of KNNLearner against the loop over query points it replaced.
+Run from StockPredictor with: python -m unittest discover -s tests
+"""
+
+import unittest
+import warnings
+import numpy as np
+from learners.KNNLearner import KNNLearner
+
+def loop_query(dataX, dataY, points, k=3):
+    # the original query, one point at a time
+    estimates = np.zeros(points.shape[0])
+    with np.errstate(invalid="ignore"):
+        for i, point in enumerate(points):
+            dist = np.sum((point - dataX)**2, axis=1)**0.5
+            estimates[i] = np.mean(dataY[np.argsort(dist)[0:k]])
+    return estimates
+
+class KNNLearnerTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.dataX = rng.rand(40, 3)
+        self.dataY = rng.rand(40)
+        self.points = rng.rand(6, 3)
+        self.points[0, 1] = np.nan
+        self.points[1, 0] = np.inf
+
+    def check(self, dataX, method):
+        learner = KNNLearner(k=3, method=method)
+        learner.addEvidence(dataX, self.dataY)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            estimates = learner.query(self.points)
+        self.assertEqual([str(w.message) for w in caught], [])
+        np.testing.assert_allclose(estimates, loop_query(dataX, self.dataY, self.points))
+
+    def test_nan_and_inf_query_points(self):
+        for method in ("brute", "kdtree"):
+            self.check(self.dataX, method)
+
+    def test_inf_training_row(self):
+        dataX = self.dataX.copy()
+        dataX[5, 0] = np.inf
+        for method in ("brute", "kdtree"):
+            self.check(dataX, method)
+
+if __name__ == "__main__":
+    unittest.main()